@@ -15,7 +15,7 @@ class UserAdmin(BaseUserAdmin):
     
     inlines = (ProfileInline,)
     
-    list_display = ('username', 'email', 'role', 'first_name', 'last_name', 'is_staff', 'date_joined')
+    list_display = ('username', 'email', 'role', 'first_name', 'last_name', 'is_staff', 'date_joined', 'last_seen')
     list_filter = ('role', 'is_staff', 'is_superuser', 'is_active')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     
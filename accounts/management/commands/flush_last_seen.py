@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+from accounts.presence import FLUSH_BATCH_SIZE, flush_last_seen
+
+
+class Command(BaseCommand):
+    help = 'Copy recent heartbeats from the cache into User.last_seen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FLUSH_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Keep running, flushing every this many seconds (0 runs once)')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                updated = flush_last_seen(options['batch_size'])
+            except DatabaseError as error:
+                if not options['interval']:
+                    raise
+                # The heartbeats stay in the cache, so the next run picks them up
+                self.stderr.write(f'Flush failed, retrying next run: {error}')
+            else:
+                self.stdout.write(f'Updated last seen for {updated} users')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
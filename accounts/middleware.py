@@ -0,0 +1,14 @@
+from django.utils.deprecation import MiddlewareMixin
+from .presence import tracker
+
+
+class PresenceMiddleware(MiddlewareMixin):
+    """Record a heartbeat for every signed-in request, for online indicators
+
+    MiddlewareMixin makes it async-capable, so streaming views served under ASGI
+    are not forced through a sync adapter.
+    """
+
+    def process_request(self, request):
+        if request.user.is_authenticated:
+            tracker.heartbeat(request.user.pk)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 21:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_remove_profile_full_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
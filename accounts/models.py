@@ -23,6 +23,9 @@ class User(AbstractUser):
         help_text="Must be unique across all users"
     )
     
+    # Written in batches by the flush_last_seen command, so it may trail the latest request by a minute or two
+    last_seen = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         ordering = ['-date_joined']
         verbose_name = 'User'
@@ -0,0 +1,126 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, Q, Value, When
+from django.utils import timezone
+from core.localstate import LocalState
+
+# A user counts as online this long after their last request
+ONLINE_SECONDS = 300
+# Each process shares a user's heartbeat through the cache at most this often
+HEARTBEAT_INTERVAL = 60
+FLUSH_BATCH_SIZE = 500
+
+
+def presence_key(user_id):
+    return f'accounts:presence:{user_id}'
+
+
+def active_key(slot, n=None):
+    """The number of heartbeats in a HEARTBEAT_INTERVAL slot, or the key of the n-th one"""
+    key = f'accounts:active:{slot}'
+    return key if n is None else f'{key}:{n}'
+
+
+class PresenceTracker:
+    """Coalesce per-request heartbeats into occasional cache writes
+
+    Heartbeats go to the cache, at most once per HEARTBEAT_INTERVAL per user and
+    process, so every process sees who is online. Requests never touch the
+    database; flush_last_seen() copies the cached times into User.last_seen.
+    """
+
+    def __init__(self):
+        self._shared = LocalState()
+
+    def heartbeat(self, user_id, now=None):
+        """Note that the user is active"""
+        now = time.time() if now is None else now
+        if now - self._shared.get(user_id, 0) < HEARTBEAT_INTERVAL:
+            return
+        self._shared.set(user_id, now)
+        cache.set(presence_key(user_id), now, ONLINE_SECONDS)
+        record_active(user_id, now)
+
+
+def record_active(user_id, now):
+    """Add the user to the ids active in the current slot, for flush_last_seen()
+
+    A slot is a counter plus one key per entry, so adding is an incr and a set
+    rather than a read-modify-write of a shared list. On a cache without an
+    atomic incr (see core.W001) two processes can take the same entry, and the
+    id lost is picked up at that user's next heartbeat.
+    """
+    slot = int(now // HEARTBEAT_INTERVAL)
+    timeout = ONLINE_SECONDS + HEARTBEAT_INTERVAL
+    cache.add(active_key(slot), 0, timeout)
+    try:
+        n = cache.incr(active_key(slot))
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(active_key(slot), 1, timeout)
+        n = 1
+    cache.set(active_key(slot, n), user_id, timeout)
+
+
+def recently_active(now=None):
+    """Ids of the users with a heartbeat in the last ONLINE_SECONDS, from two cache lookups"""
+    now = time.time() if now is None else now
+    last = int(now // HEARTBEAT_INTERVAL)
+    slots = range(last - ONLINE_SECONDS // HEARTBEAT_INTERVAL, last + 1)
+    counts = cache.get_many([active_key(slot) for slot in slots])
+    return set(cache.get_many([
+        active_key(slot, n) for slot in slots for n in range(1, counts.get(active_key(slot), 0) + 1)
+    ]).values())
+
+
+def flush_last_seen(batch_size=FLUSH_BATCH_SIZE, now=None):
+    """Write the heartbeats in the cache to User.last_seen; returns users updated
+
+    Only users in the cache's list of recent heartbeats are looked at, with one
+    cache lookup and at most one update per batch, so the cost follows how many
+    users are active rather than how many exist. Heartbeats expire after
+    ONLINE_SECONDS, so this has to run more often than that.
+    """
+    from .models import User
+
+    ids = sorted(recently_active(now))
+    updated = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        recent = cache.get_many([presence_key(pk) for pk in batch])
+        seen = {pk: recent[presence_key(pk)] for pk in batch if presence_key(pk) in recent}
+        if not seen:
+            continue
+        last_seen = Case(
+            *[When(pk=pk, then=Value(to_datetime(timestamp))) for pk, timestamp in seen.items()],
+            output_field=DateTimeField(),
+        )
+        # Unchanged times are not rewritten, and a later time is never moved back
+        updated += User.objects.filter(
+            Q(last_seen__isnull=True) | Q(last_seen__lt=last_seen), pk__in=seen
+        ).update(last_seen=last_seen)
+    return updated
+
+
+def to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc)
+
+
+tracker = PresenceTracker()
+
+
+def attach_presence(users):
+    """Set ``last_seen_at`` and ``is_online`` on each user from one cache lookup
+
+    Recent heartbeats come from the cache; anyone not seen lately falls back to
+    the last_seen stored on the loaded user, so the database is not queried.
+    """
+    users = list(users)
+    recent = cache.get_many([presence_key(user.pk) for user in users])
+    online_since = timezone.now() - timedelta(seconds=ONLINE_SECONDS)
+    for user in users:
+        seen = recent.get(presence_key(user.pk))
+        user.last_seen_at = to_datetime(seen) if seen else user.last_seen
+        user.is_online = bool(user.last_seen_at and user.last_seen_at >= online_since)
+    return users
@@ -1,3 +1,100 @@
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from .middleware import PresenceMiddleware
+from .models import User
+from .presence import (
+    HEARTBEAT_INTERVAL, ONLINE_SECONDS, PresenceTracker, attach_presence, flush_last_seen, presence_key,
+    recently_active, to_datetime,
+)
 
-# Create your tests here.
+
+class PresenceTests(TestCase):
+    """Heartbeats reach the cache at most once a minute and the database in batches, off the request path"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+        # A fresh tracker, so heartbeats from other tests cannot be coalesced into these
+        self.tracker = PresenceTracker()
+        patcher = mock.patch('accounts.middleware.tracker', self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_heartbeats_are_coalesced(self):
+        start = 1_000_000
+        with self.assertNumQueries(0):
+            for offset in range(0, HEARTBEAT_INTERVAL, 5):
+                self.tracker.heartbeat(self.alice.pk, now=start + offset)
+            self.assertEqual(cache.get(presence_key(self.alice.pk)), start)
+            self.tracker.heartbeat(self.alice.pk, now=start + HEARTBEAT_INTERVAL)
+            self.assertEqual(cache.get(presence_key(self.alice.pk)), start + HEARTBEAT_INTERVAL)
+
+    def test_flush_writes_one_update_per_batch(self):
+        start = 1_000_000
+        self.tracker.heartbeat(self.alice.pk, now=start)
+        self.tracker.heartbeat(self.bob.pk, now=start + HEARTBEAT_INTERVAL + 1)
+        # The active users come from the cache, so the only query is the update
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_last_seen(now=start + HEARTBEAT_INTERVAL + 1), 2)
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.last_seen, to_datetime(start))
+        self.assertEqual(self.bob.last_seen, to_datetime(start + HEARTBEAT_INTERVAL + 1))
+        # Nothing new to write the next time round
+        self.assertEqual(flush_last_seen(now=start + HEARTBEAT_INTERVAL + 1), 0)
+
+    def test_flush_skips_inactive_users(self):
+        start = 1_000_000
+        for i in range(5):
+            User.objects.create_user(f'idle{i}', f'idle{i}@example.com', 'pass')
+        with self.assertNumQueries(0):
+            self.assertEqual(flush_last_seen(now=start), 0)
+        self.tracker.heartbeat(self.alice.pk, now=start)
+        self.assertEqual(recently_active(now=start + 10), {self.alice.pk})
+        # Long enough ago that the heartbeat has expired
+        self.assertEqual(recently_active(now=start + ONLINE_SECONDS + HEARTBEAT_INTERVAL), set())
+
+    def test_flush_never_moves_back(self):
+        start = 1_000_000
+        User.objects.filter(pk=self.alice.pk).update(last_seen=to_datetime(start + 10))
+        self.tracker.heartbeat(self.alice.pk, now=start)
+        self.assertEqual(flush_last_seen(now=start), 0)
+
+    def test_requests_never_write_last_seen(self):
+        self.client.force_login(self.alice)
+        self.client.get(reverse('accounts:members'))
+        self.alice.refresh_from_db()
+        self.assertIsNone(self.alice.last_seen)
+        self.assertIsNotNone(cache.get(presence_key(self.alice.pk)))
+
+        out = StringIO()
+        call_command('flush_last_seen', interval=0, stdout=out)
+        self.assertEqual(out.getvalue(), 'Updated last seen for 1 users\n')
+
+    async def test_async_requests_record_heartbeats(self):
+        self.assertTrue(PresenceMiddleware.async_capable)
+        await self.async_client.aforce_login(self.alice)
+        await self.async_client.get(reverse('accounts:members'))
+        self.assertIsNotNone(await cache.aget(presence_key(self.alice.pk)))
+
+    def test_attach_presence_uses_one_cache_lookup(self):
+        self.tracker.heartbeat(self.alice.pk)
+        users = list(User.objects.order_by('username'))
+        with self.assertNumQueries(0):
+            alice, bob = attach_presence(users)
+        self.assertTrue(alice.is_online)
+        self.assertFalse(bob.is_online)
+        self.assertIsNone(bob.last_seen_at)
+
+    def test_members_page_shows_online(self):
+        self.client.force_login(self.bob)
+        response = self.client.get(reverse('accounts:members'))
+        self.assertContains(response, 'Online')
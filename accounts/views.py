@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate, get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from .presence import attach_presence
 
 User = get_user_model()
 
@@ -69,15 +70,18 @@ def members_list_view(request):
     """View all club members and admins (visible to all logged-in users)"""
     from accounts.models import User
     
-    admins = User.objects.filter(role='admin').select_related('profile').order_by('username')
-    members = User.objects.filter(role='member').select_related('profile').order_by('username')
+    admins = list(User.objects.filter(role='admin').select_related('profile').order_by('username'))
+    members = list(User.objects.filter(role='member').select_related('profile').order_by('username'))
+    
+    # Online status for everyone on the page from one cache lookup
+    attach_presence(admins + members)
     
     context = {
         'admins': admins,
         'members': members,
-        'total_admins': admins.count(),
-        'total_members': members.count(),
-        'total_participants': admins.count() + members.count(),
+        'total_admins': len(admins),
+        'total_members': len(members),
+        'total_participants': len(admins) + len(members),
     }
     return render(request, 'accounts/members.html', context)
 
@@ -0,0 +1,40 @@
+from django.conf import settings
+
+MESSAGING_DB = 'messaging'
+
+
+class MessagingRouter:
+    """Keep the messaging app on its own database and everything else on default
+
+    Chat writes then never hold the main database's write lock. Messaging rows
+    still point at accounts.User (and team channels at their competition), but
+    across databases: those foreign keys carry no database constraint and the
+    rows are loaded with separate queries, never joins.
+    """
+
+    app_labels = {'messaging'}
+    # Default database models that messaging rows may reference
+    cross_database_models = {settings.AUTH_USER_MODEL, 'competitions.Competition'}
+
+    def db_for_model(self, model):
+        return MESSAGING_DB if model._meta.app_label in self.app_labels else 'default'
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_model(model)
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_model(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.db_for_model(obj1) == self.db_for_model(obj2):
+            return True
+        # Messaging may reference users and competitions in the default database,
+        # nothing else crosses over
+        labels = {obj1._meta.label, obj2._meta.label}
+        return bool(labels & self.cross_database_models)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label in self.app_labels:
+            return db == MESSAGING_DB
+        return db == 'default'
+
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.PresenceMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
@@ -88,9 +89,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # Chat traffic lives in its own SQLite file so message writes never take the main write lock
+    'messaging': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'messaging.sqlite3',
+    },
+}
+
+DATABASE_ROUTERS = ['club_website.routers.MessagingRouter']
+
+
+# Cache
+# File-based so every worker process on this host shares cached block sets, mailbox
+# versions, rate limit counts and leaderboard snapshots. Its add() and incr() are not
+# atomic across processes, so rate limits and single-flight leaderboard rebuilds are
+# best-effort here. Run several workers against an atomic backend instead, e.g.
+# 'django.core.cache.backends.redis.RedisCache' with LOCATION 'redis://127.0.0.1:6379'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+# Tests get an in-memory cache of their own, so clearing it never touches the site's
+TEST_RUNNER = 'club_website.test_runner.IsolatedCacheRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -139,6 +168,26 @@ MESSAGE_TAGS = {
     messages.ERROR: 'danger',
 }
 
+# Group chat write-behind: buffer bursts of group messages for a few milliseconds
+# and insert them together in one transaction (off by default)
+MESSAGING_GROUP_BATCHING = False
+MESSAGING_GROUP_BATCH_WINDOW = 0.005  # seconds
+MESSAGING_GROUP_BATCH_SIZE = 200
+# A send waits this long for the flusher before saving its message directly
+MESSAGING_GROUP_BATCH_TIMEOUT = 2.0  # seconds
+
+# Messages older than this move to the compressed archive (manage.py archive_messages)
+MESSAGING_ARCHIVE_AFTER_DAYS = 365
+MESSAGING_ARCHIVE_BATCH_SIZE = 500
+
+# Sliding window rate limits per endpoint scope: (requests, window in seconds).
+# Counts are kept in the cache so every worker process shares them (core.ratelimit)
+RATE_LIMITS = {
+    'messaging.send': (30, 60),
+    'messaging.send_group': (30, 60),
+    'messaging.poll': (120, 60),
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
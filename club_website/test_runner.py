@@ -0,0 +1,21 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+    """Run tests against a throwaway in-memory cache
+
+    Tests clear the cache freely; with the project's file-based cache that
+    would wipe the counters, snapshots and block sets of the running site.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_override = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        })
+        self._cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_override.disable()
+        super().teardown_test_environment(**kwargs)
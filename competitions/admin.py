@@ -7,10 +7,32 @@ class ProblemInline(admin.TabularInline):
 
 @admin.register(Competition)
 class CompetitionAdmin(admin.ModelAdmin):
-    list_display = ('title', 'status', 'start_date', 'end_date', 'total_participants', 'created_by')
+    list_display = ('title', 'status', 'start_date', 'end_date', 'participant_count', 'problem_count', 'created_by')
     list_filter = ('status', 'start_date')
     search_fields = ('title', 'description')
+    list_select_related = ('created_by',)
     inlines = [ProblemInline]
+    actions = ['close_now']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_counts()
+    
+    @admin.display(description='Participants', ordering='participant_count')
+    def participant_count(self, obj):
+        return obj.participant_count
+    
+    @admin.display(description='Problems', ordering='problem_count')
+    def problem_count(self, obj):
+        return obj.problem_count
+    
+    @admin.action(description='Close selected competitions now')
+    def close_now(self, request, queryset):
+        # Status follows the dates, so closing early means ending now
+        closed = 0
+        for competition in queryset.exclude(status='completed'):
+            competition.close_now()
+            closed += 1
+        self.message_user(request, f'Closed {closed} competition{"s" if closed != 1 else ""}.')
 
 @admin.register(Problem)
 class ProblemAdmin(admin.ModelAdmin):
@@ -4,12 +4,15 @@ from .models import Competition, Problem, Submission
 class CompetitionForm(forms.ModelForm):
     class Meta:
         model = Competition
-        fields = ['title', 'description', 'start_date', 'end_date', 'status', 'max_score']
+        fields = ['title', 'description', 'start_date', 'end_date', 'max_score']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 5}),
             'start_date': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
             'end_date': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
         }
+        help_texts = {
+            'end_date': 'Status follows these dates. Set the end to now to close early, or move it later to reopen.',
+        }
 
 class ProblemForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,141 @@
+import time
+from typing import NamedTuple
+from django.core.cache import cache
+from .pagination import fetch_page
+
+LEADERBOARD_CACHE_TIMEOUT = 600
+# Closed competitions only change when an admin rescores, which retires the snapshot anyway
+CLOSED_LEADERBOARD_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+# A rebuild holds its lock at most this long; other requests wait up to REBUILD_WAIT for it
+REBUILD_LOCK_TIMEOUT = 10
+REBUILD_WAIT = 2.0
+REBUILD_POLL_INTERVAL = 0.05
+
+
+class LeaderboardEntry(NamedTuple):
+    """One row of a leaderboard snapshot"""
+
+    position: int
+    submission_id: int
+    user_id: int
+    username: str
+    first_name: str
+    last_name: str
+    score: int
+
+
+class LeaderboardPage(NamedTuple):
+    entries: tuple
+    has_next: bool
+
+
+def version_key(competition_id):
+    return f'competitions:leaderboard-version:{competition_id}'
+
+
+def new_version():
+    # Any fresh value works: snapshots are only looked up under the current one
+    return format(time.time_ns(), 'x')
+
+
+def bump_leaderboard(competition_id):
+    """Retire every snapshot of a competition's leaderboard, after its order changed"""
+    cache.set(version_key(competition_id), new_version(), None)
+
+
+def leaderboard_version(competition_id):
+    """The current version stamp, starting a fresh one if it was never set or evicted"""
+    key = version_key(competition_id)
+    version = cache.get(key)
+    if version is None:
+        version = new_version()
+        if not cache.add(key, version, None):
+            # Another request started one first
+            version = cache.get(key, version)
+    return version
+
+
+def single_flight(key, build, timeout=LEADERBOARD_CACHE_TIMEOUT, cacheable=None):
+    """The cached value for ``key``, rebuilt on a miss by as few requests as the cache allows
+
+    The request that takes the lock builds and caches the value; the others poll
+    the cache for it instead of running the same queries. If the builder has
+    not delivered within REBUILD_WAIT, or released the lock without caching
+    anything, a waiter builds it itself. ``cacheable``, if given, is called with
+    a freshly built value and decides whether it is stored.
+
+    The lock is a cache.add(), so only one request builds when add() is atomic,
+    as on Redis or Memcached. On the file-based cache it is check-then-write,
+    and two workers can occasionally both build: stampedes shrink but are not
+    ruled out.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, REBUILD_LOCK_TIMEOUT):
+        try:
+            value = build()
+            if cacheable is None or cacheable(value):
+                cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(REBUILD_POLL_INTERVAL)
+        # The lock is read first: a builder stores its value before releasing it
+        locked = cache.get(lock_key) is not None
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if not locked:
+            break
+    return build()
+
+
+def snapshot_timeout(competition):
+    if competition.status == 'completed':
+        return CLOSED_LEADERBOARD_CACHE_TIMEOUT
+    return LEADERBOARD_CACHE_TIMEOUT
+
+
+def to_entry(submission):
+    return LeaderboardEntry(
+        submission.position, submission.pk, submission.user_id, submission.user.username,
+        submission.user.first_name, submission.user.last_name, submission.score,
+    )
+
+
+def leaderboard_page(competition, page, page_size):
+    """One page of the competition's current leaderboard snapshot"""
+    version = leaderboard_version(competition.pk)
+
+    def build():
+        rows, has_next = fetch_page(
+            lambda limit, offset: competition.leaderboard(limit, offset=offset)[0], page, page_size,
+        )
+        return LeaderboardPage(tuple(to_entry(submission) for submission in rows), has_next)
+
+    # Pages past the end are not cached, so made-up page numbers cannot fill the cache
+    return single_flight(
+        f'competitions:leaderboard:{competition.pk}:{version}:{page_size}:{page}', build, snapshot_timeout(competition),
+        cacheable=lambda result: page == 1 or bool(result.entries),
+    )
+
+
+def leaderboard_entry(competition, user):
+    """The user's own row in the current snapshot, or None if they have not submitted"""
+    version = leaderboard_version(competition.pk)
+
+    def build():
+        # An empty page: only the user's row is loaded
+        _, own = competition.leaderboard(0, user=user)
+        # Wrapped, so that "no submission" is cached too
+        return (to_entry(own) if own else None,)
+
+    return single_flight(
+        f'competitions:leaderboard:{competition.pk}:{version}:user:{user.pk}', build, snapshot_timeout(competition),
+    )[0]
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from competitions.models import Competition
+
+
+class Command(BaseCommand):
+    help = 'Open and close competitions as their start and end dates pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=30,
+                            help='Check every this many seconds (0 runs once)')
+
+    def handle(self, *args, **options):
+        while True:
+            self.run()
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def run(self):
+        changed = Competition.objects.advance_status()
+        for status, ids in changed.items():
+            self.stdout.write(f'{len(ids)} competition{"s" if len(ids) != 1 else ""} now {status}')
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import User
+from competitions.models import Competition, Submission
+from competitions.views import LEADERBOARD_PAGE_SIZE
+from core.benchmarks import benchmark_database, time_call
+
+
+class Command(BaseCommand):
+    help = 'Benchmark a leaderboard page with the user\'s own rank against loading every submission'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            now = timezone.now()
+            organiser = User.objects.create_user('bench_admin', 'admin@bench.local', 'pass', role='admin')
+            competition = Competition.objects.create(
+                title='Benchmark', description='', start_date=now, end_date=now + timedelta(days=1),
+                created_by=organiser,
+            )
+
+            self.stdout.write(
+                f"{'submissions':>12} {'top page':>10} {'deep page':>11} {'load all':>10}"
+            )
+            for size in sorted(options['sizes']):
+                users = self.fill(competition, size)
+                middle = users[len(users) // 2]
+
+                top = time_call(lambda: competition.leaderboard(LEADERBOARD_PAGE_SIZE + 1, user=middle))
+                deep = time_call(lambda: competition.leaderboard(LEADERBOARD_PAGE_SIZE + 1, offset=size // 2, user=middle))
+                # What the leaderboard used to do: every submission with its user
+                full = time_call(lambda: list(competition.submissions.select_related('user')), repeat=1)
+
+                self.stdout.write(f"{size:>12} {top:>8.2f}ms {deep:>9.2f}ms {full:>8.1f}ms")
+
+    def fill(self, competition, size):
+        """Top the competition up to ``size`` submissions, one per user; returns their users"""
+        have = competition.submissions.count()
+        users = User.objects.bulk_create([
+            User(username=f'bench_{i}', email=f'bench_{i}@bench.local', password='!')
+            for i in range(have, size)
+        ], batch_size=5000)
+        Submission.objects.bulk_create([
+            Submission(competition=competition, user=user, solution='...', score=(i * 7919) % 101)
+            for i, user in enumerate(users, start=have)
+        ], batch_size=5000)
+        return users or list(User.objects.filter(username__startswith='bench_').exclude(role='admin')[:1])
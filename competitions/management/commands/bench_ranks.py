@@ -0,0 +1,69 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import User
+from competitions.models import Competition, Submission
+from core.benchmarks import benchmark_database, time_call
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rescoring one submission: per-row rank saves, one bulk recompute, and the range shift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+        parser.add_argument('--skip-per-row', action='store_true', help='Skip timing the old per-row saves')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            now = timezone.now()
+            organiser = User.objects.create_user('bench_admin', 'admin@bench.local', 'pass', role='admin')
+
+            self.stdout.write(f"{'submissions':>12} {'per-row save':>14} {'recompute':>11} {'range shift':>13}")
+            for size in sorted(options['sizes']):
+                competition = Competition.objects.create(
+                    title=f'Benchmark {size}', description='', start_date=now,
+                    end_date=now + timedelta(days=1), created_by=organiser,
+                )
+                self.fill(competition, size)
+                competition.recompute_ranks()
+                submission = competition.submissions.order_by('score', 'id')[size // 2]
+
+                def rescore(then):
+                    # Alternate the score up and down so every run moves the ranking
+                    def run():
+                        submission.score = submission.score + 13 if submission.score < 50 else submission.score - 13
+                        Submission.objects.filter(pk=submission.pk).update(score=submission.score)
+                        submission._stored_score = submission.score
+                        then()
+                    return run
+
+                per_row = '-' if options['skip_per_row'] else f"{time_call(rescore(lambda: self.per_row(competition)), repeat=1):.1f}ms"
+                recompute = time_call(rescore(competition.recompute_ranks))
+                shift = time_call(lambda: self.shift(submission))
+
+                self.stdout.write(f"{size:>12} {per_row:>14} {recompute:>9.2f}ms {shift:>11.2f}ms")
+
+    def fill(self, competition, size):
+        users = User.objects.bulk_create([
+            User(username=f'bench_{size}_{i}', email=f'bench_{size}_{i}@bench.local', password='!')
+            for i in range(size)
+        ], batch_size=5000)
+        Submission.objects.bulk_create([
+            Submission(competition=competition, user=user, solution='...', score=(i * 7919) % 101)
+            for i, user in enumerate(users)
+        ], batch_size=5000)
+
+    def per_row(self, competition):
+        """What score_submission used to do: save every submission's rank on its own"""
+        submissions = list(competition.submissions.order_by('-score', 'submitted_at'))
+        current_rank = 1
+        for i, submission in enumerate(submissions):
+            submission.rank = current_rank
+            submission.save(update_fields=['rank'])
+            if i + 1 < len(submissions) and submissions[i + 1].score < submission.score:
+                current_rank = i + 2
+
+    def shift(self, submission):
+        """Save a new score the way score_submission does now"""
+        submission.score = submission.score + 13 if submission.score < 50 else submission.score - 13
+        submission.save(update_fields=['score'])
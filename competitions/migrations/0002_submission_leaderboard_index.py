@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 21:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['competition', '-score', 'submitted_at', 'id'], name='submission_leaderboard_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 22:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0002_submission_leaderboard_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('rank__isnull', True)), fields=['competition'], name='submission_unranked_idx'),
+        ),
+    ]
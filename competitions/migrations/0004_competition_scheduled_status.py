@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-17 23:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def derive_status(apps, schema_editor):
+    """Set every stored status from the dates, which it follows from now on"""
+    Competition = apps.get_model('competitions', 'Competition')
+    competitions = Competition.objects.using(schema_editor.connection.alias)
+    now = timezone.now()
+    competitions.filter(end_date__lte=now).update(status='completed')
+    competitions.filter(start_date__lte=now, end_date__gt=now).update(status='active')
+    competitions.filter(start_date__gt=now, end_date__gt=now).update(status='upcoming')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0003_submission_unranked_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='competition',
+            name='status',
+            field=models.CharField(choices=[('upcoming', 'Upcoming'), ('active', 'Active'), ('completed', 'Completed')], default='upcoming', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='competition',
+            index=models.Index(fields=['status', 'start_date'], name='competition_to_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='competition',
+            index=models.Index(fields=['status', 'end_date'], name='competition_to_end_idx'),
+        ),
+        migrations.RunPython(derive_status, migrations.RunPython.noop),
+    ]
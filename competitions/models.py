@@ -1,5 +1,57 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When, Window
+from django.db.models.functions import Coalesce, Rank
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
 from django.conf import settings
+from django.utils import timezone
+from .leaderboard import bump_leaderboard
+
+RANK_UPDATE_BATCH_SIZE = 500
+
+# Sent with ``status`` and ``competition_ids`` once competitions have moved to a new status
+competition_status_changed = Signal()
+
+
+class CompetitionQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate ``participant_count`` and ``problem_count`` in the same query
+        
+        Each count is a correlated subquery on the foreign key index, so the
+        competitions are neither joined against every submission nor grouped.
+        """
+        # One submission per user and competition: counting submissions counts participants
+        participants = Submission.objects.filter(competition=OuterRef('pk')).order_by().values(
+            'competition'
+        ).annotate(total=Count('pk')).values('total')
+        problems = Problem.objects.filter(competition=OuterRef('pk')).order_by().values(
+            'competition'
+        ).annotate(total=Count('pk')).values('total')
+        return self.annotate(
+            participant_count=Coalesce(Subquery(participants), 0),
+            problem_count=Coalesce(Subquery(problems), 0),
+        )
+    
+    def advance_status(self, now=None):
+        """Move on every competition whose start or end has passed; returns {status: ids}
+        
+        One UPDATE per transition, found through the status and date indexes.
+        Sends competition_status_changed for each transition.
+        """
+        now = timezone.now() if now is None else now
+        changed = {}
+        # Closing first, so a competition that both started and ended since the last run closes at once
+        for status, due in (
+            ('completed', Q(status__in=['upcoming', 'active'], end_date__lte=now)),
+            ('active', Q(status='upcoming', start_date__lte=now)),
+        ):
+            ids = list(self.filter(due).order_by().values_list('pk', flat=True))
+            # Still guarded, in case another run moved some of them in between
+            if ids and self.filter(due, pk__in=ids).update(status=status):
+                changed[status] = ids
+                competition_status_changed.send(sender=Competition, status=status, competition_ids=ids)
+        return changed
+
 
 class Competition(models.Model):
     """Programming competition"""
@@ -14,7 +66,8 @@ class Competition(models.Model):
     description = models.TextField()
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='upcoming')
+    # Follows the dates: set on save, then moved on by Competition.objects.advance_status()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='upcoming', editable=False)
     max_score = models.PositiveIntegerField(default=100)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -23,29 +76,142 @@ class Competition(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = CompetitionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # Competitions due to start or end, for the scheduler
+            models.Index(fields=['status', 'start_date'], name='competition_to_start_idx'),
+            models.Index(fields=['status', 'end_date'], name='competition_to_end_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status, so a save can tell whether it moved
+        instance._stored_status = instance.__dict__.get('status')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        stored_status = getattr(self, '_stored_status', None)
+        self.status = self.scheduled_status()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'status'}
+        super().save(*args, **kwargs)
+        self._stored_status = self.status
+        if self.status != stored_status:
+            competition_status_changed.send(sender=Competition, status=self.status, competition_ids=[self.pk])
+    
+    def close_now(self, now=None):
+        """End the competition early; it reopens if end_date is moved back into the future"""
+        now = timezone.now() if now is None else now
+        self.end_date = now
+        self.start_date = min(self.start_date, now)
+        self.save(update_fields=['start_date', 'end_date'])
+    
+    def scheduled_status(self, now=None):
+        """The status the start and end dates call for"""
+        now = timezone.now() if now is None else now
+        if now >= self.end_date:
+            return 'completed'
+        if now >= self.start_date:
+            return 'active'
+        return 'upcoming'
+    
     @property
     def total_participants(self):
+        """Prefer Competition.objects.with_counts(), which avoids a query per competition"""
+        if hasattr(self, 'participant_count'):
+            return self.participant_count
         return self.submissions.values('user').distinct().count()
     
-    @property
-    def leaderboard(self):
-        """Get sorted leaderboard"""
-        submissions = self.submissions.select_related('user').order_by('-score', 'submitted_at')
-        leaders = []
-        seen_users = set()
+    def leaderboard(self, limit, offset=0, user=None):
+        """One page of the leaderboard and the user's own entry, from two queries
+        
+        Each user has one submission per competition, so the submissions are the
+        leaderboard. Positions come from RANK() over the score, so ties share a place.
+        The window runs over ids alone, on the leaderboard index; only the page and
+        the user's row are then loaded with their users. Returns the page, each
+        submission with its ``position``, and the user's submission with its
+        position, or None.
+        """
+        ranked = self.submissions.annotate(
+            position=Window(Rank(), order_by=F('score').desc()),
+        ).order_by('-score', 'submitted_at', 'id').values_list('id', 'position')
+        positions = dict(ranked[offset:offset + limit])
         
-        for submission in submissions:
-            if submission.user_id not in seen_users:
-                seen_users.add(submission.user_id)
-                leaders.append(submission)
+        # The user's place is the one RANK() gives: one more than the number of higher scores.
+        # CASE only runs the count for the user's row
+        higher = Submission.objects.filter(
+            competition=OuterRef('competition'), score__gt=OuterRef('score')
+        ).order_by().values('competition').annotate(total=Count('pk')).values('total')
+        mine = Q(competition=self, user=user) if user is not None else Q(pk__in=[])
+        rows = Submission.objects.filter(Q(pk__in=positions) | mine).select_related('user').annotate(
+            own_position=Case(When(mine, then=Coalesce(Subquery(higher), 0) + Value(1))),
+        )
+        
+        page, own = [], None
+        for submission in rows.order_by('-score', 'submitted_at', 'id'):
+            if submission.own_position is not None:
+                own = submission
+                submission.position = submission.own_position
+            if submission.pk in positions:
+                submission.position = positions[submission.pk]
+                page.append(submission)
+        return page, own
+    
+    def recompute_ranks(self):
+        """Rewrite every stored rank from one RANK() query; returns the number changed
         
-        return leaders
+        Only rows whose rank actually changed are written, with one bulk_update
+        in one transaction.
+        """
+        ranked = self.submissions.annotate(
+            position=Window(Rank(), order_by=F('score').desc()),
+        ).order_by().values_list('id', 'position', 'rank')
+        changed = [Submission(pk=pk, rank=position) for pk, position, rank in ranked if position != rank]
+        with transaction.atomic():
+            Submission.objects.bulk_update(changed, ['rank'], batch_size=RANK_UPDATE_BATCH_SIZE)
+        return len(changed)
+    
+    def shift_ranks(self, submission_id, old_score, new_score):
+        """Keep stored ranks right after one submission was added, rescored or removed
+        
+        ``old_score`` is None for a new submission and ``new_score`` None for a
+        removed one. A rank is one more than the number of higher scores, so only
+        the scores the submission passed over move, by one, in a single range
+        update; the submission itself is placed with one more. Falls back to
+        recompute_ranks() while some submission has no rank yet.
+        """
+        if old_score == new_score:
+            return
+        # Writes come first: on SQLite a read would take a shared lock that then
+        # cannot be upgraded while another connection is writing
+        with transaction.atomic():
+            others = self.submissions.exclude(pk=submission_id)
+            if old_score is None:
+                # Joined: everyone below now has one more score above them
+                others.filter(score__lt=new_score).update(rank=F('rank') + 1)
+            elif new_score is None:
+                others.filter(score__lt=old_score).update(rank=F('rank') - 1)
+            elif new_score > old_score:
+                # Passed the scores in [old, new): each of those drops one place
+                others.filter(score__gte=old_score, score__lt=new_score).update(rank=F('rank') + 1)
+            else:
+                others.filter(score__gte=new_score, score__lt=old_score).update(rank=F('rank') - 1)
+            
+            if new_score is not None:
+                higher = others.filter(score__gt=new_score).order_by().values('competition').annotate(
+                    total=Count('pk')
+                ).values('total')
+                Submission.objects.filter(pk=submission_id).update(rank=Coalesce(Subquery(higher), 0) + 1)
+            
+            if self.submissions.filter(rank__isnull=True).exists():
+                self.recompute_ranks()
 
 
 class Problem(models.Model):
@@ -98,6 +264,93 @@ class Submission(models.Model):
     class Meta:
         ordering = ['-score', 'submitted_at']
         unique_together = ['competition', 'user']
+        indexes = [
+            # Leaderboard order within a competition, and counting higher scores for a rank
+            models.Index(fields=['competition', '-score', 'submitted_at', 'id'], name='submission_leaderboard_idx'),
+            # Finding submissions still waiting for a rank, without reading the rest
+            models.Index(fields=['competition'], condition=Q(rank__isnull=True), name='submission_unranked_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.competition.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.competition.title}"
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'score' not in update_fields:
+            return super().save(*args, **kwargs)
+        # The score write and the rank shift of the post_save receiver commit together
+        with transaction.atomic(savepoint=False):
+            self._stored_score = None
+            if not self._state.adding:
+                self.lock_stored_rank()
+            super().save(*args, **kwargs)
+    
+    def lock_stored_rank(self):
+        """Lock the row, then reload the score and rank it currently holds
+        
+        Writing the row first takes its lock on every backend (SQLite has no
+        SELECT ... FOR UPDATE), so concurrent rescores of one submission queue
+        up and each shifts the ranks from the score actually stored. The rank is
+        reloaded so that a full save writes back the current one, not a stale copy.
+        """
+        row = Submission.objects.filter(pk=self.pk)
+        row.update(rank=F('rank'))
+        stored = row.values_list('score', 'rank').first()
+        if stored:
+            self._stored_score, self.rank = stored
+
+
+# Stored ranks follow every score change with a range update, never a rewrite
+@receiver(post_save, sender=Submission)
+def rerank_saved_submission(sender, instance, created, update_fields=None, **kwargs):
+    """Shift the stored ranks for a new or rescored submission
+    
+    Runs inside the transaction Submission.save() opened, from the score it
+    read under the row lock.
+    """
+    if update_fields is not None and 'score' not in update_fields:
+        return
+    competition = Competition(pk=instance.competition_id)
+    stored_score = getattr(instance, '_stored_score', None)
+    if created:
+        competition.shift_ranks(instance.pk, None, instance.score)
+    elif stored_score is None:
+        # Saved without going through Submission.save(): the old place is unknown
+        competition.recompute_ranks()
+    elif stored_score != instance.score:
+        competition.shift_ranks(instance.pk, stored_score, instance.score)
+    else:
+        return
+    reorder_leaderboard(competition.pk)
+
+
+@receiver(post_delete, sender=Submission)
+def rerank_deleted_submission(sender, instance, origin=None, **kwargs):
+    """Move everyone below a removed submission up a place"""
+    # Deleting the whole competition leaves nothing to rank
+    if isinstance(origin, Competition) or getattr(origin, 'model', None) is Competition:
+        return
+    Competition(pk=instance.competition_id).shift_ranks(instance.pk, instance.score, None)
+    reorder_leaderboard(instance.competition_id)
+
+
+def reorder_leaderboard(competition_id):
+    """Retire the cached leaderboard once the new order is committed
+    
+    Bumping any earlier would let a request rebuild the snapshot from the old
+    order under the new version.
+    """
+    transaction.on_commit(lambda: bump_leaderboard(competition_id))
+
+
+@receiver(competition_status_changed, sender=Competition)
+def settle_final_ranks(sender, status, competition_ids, **kwargs):
+    """Recompute the final standings once a competition closes to submissions
+    
+    Scores stay editable afterwards; a rescore shifts the ranks as usual.
+    """
+    if status != 'completed':
+        return
+    for competition_id in competition_ids:
+        Competition(pk=competition_id).recompute_ranks()
+        reorder_leaderboard(competition_id)
\ No newline at end of file
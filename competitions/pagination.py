@@ -0,0 +1,15 @@
+def page_number(request):
+    """The 1-based ?page= number, falling back to the first page when missing or invalid"""
+    try:
+        return max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return 1
+
+
+def fetch_page(fetch, page, page_size):
+    """One page of rows from ``fetch(limit, offset)``, and whether another page follows
+
+    One extra row tells whether there is a next page, so no count query is needed.
+    """
+    rows = list(fetch(page_size + 1, (page - 1) * page_size))
+    return rows[:page_size], len(rows) > page_size
@@ -1,3 +1,342 @@
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from .leaderboard import (
+    REBUILD_WAIT, bump_leaderboard, leaderboard_entry, leaderboard_page, leaderboard_version, single_flight,
+)
+from .models import Competition, Problem, Submission
 
-# Create your tests here.
+
+class LeaderboardTests(TestCase):
+    """The leaderboard is ranked in SQL and returns a page plus the user's own row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', role='admin')
+        cls.competition = Competition.objects.create(
+            title='Contest', description='', start_date=now, end_date=now + timedelta(days=1), created_by=cls.admin,
+        )
+        cls.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass') for i in range(6)]
+        for user, score in zip(cls.users, [50, 90, 90, 70, 10, 70]):
+            Submission.objects.create(competition=cls.competition, user=user, solution='...', score=score)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_positions_share_ties(self):
+        page, own = self.competition.leaderboard(10)
+        self.assertEqual(
+            [(s.user.username, s.position) for s in page],
+            [('user1', 1), ('user2', 1), ('user3', 3), ('user5', 3), ('user0', 5), ('user4', 6)],
+        )
+        self.assertIsNone(own)
+
+    def test_page_and_own_entry_in_two_queries(self):
+        with self.assertNumQueries(2):
+            page, own = self.competition.leaderboard(2, offset=2, user=self.users[4])
+            names = [s.user.username for s in page]
+        self.assertEqual(names, ['user3', 'user5'])
+        self.assertEqual((own.user, own.position), (self.users[4], 6))
+
+    def test_view_paginates(self):
+        self.client.force_login(self.users[0])
+        response = self.client.get(reverse('competitions:leaderboard', args=[self.competition.pk]))
+        self.assertEqual(len(response.context['leaderboard']), 6)
+        self.assertFalse(response.context['has_next'])
+        self.assertEqual(response.context['my_entry'].position, 5)
+
+
+class RankTests(TestCase):
+    """Stored ranks follow score changes with range updates instead of per-row saves"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', role='admin')
+        cls.competition = Competition.objects.create(
+            title='Contest', description='', start_date=now, end_date=now + timedelta(days=1), created_by=cls.admin,
+        )
+        cls.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass') for i in range(8)]
+        for user, score in zip(cls.users, [50, 90, 90, 70, 10, 70, 0, 30]):
+            Submission.objects.create(competition=cls.competition, user=user, solution='...', score=score)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertRanksCorrect(self):
+        stored = dict(self.competition.submissions.values_list('id', 'rank'))
+        self.assertEqual(self.competition.recompute_ranks(), 0, stored)
+
+    def rescore(self, index, score):
+        submission = Submission.objects.get(competition=self.competition, user=self.users[index])
+        submission.score = score
+        submission.save()
+
+    def test_new_submissions_are_ranked(self):
+        self.assertEqual(
+            list(self.competition.submissions.order_by('-score', 'id').values_list('rank', flat=True)),
+            [1, 1, 3, 3, 5, 6, 7, 8],
+        )
+
+    def test_rescoring_up_and_down(self):
+        for index, score in [(4, 80), (1, 20), (6, 70), (3, 0), (0, 50), (2, 100)]:
+            self.rescore(index, score)
+            self.assertRanksCorrect()
+
+    def test_rescore_is_constant_queries(self):
+        submission = Submission.objects.get(competition=self.competition, user=self.users[4])
+        submission.score = 95
+        # Row lock, stored score, save, then range shift, own place and the unranked check in a savepoint
+        with self.assertNumQueries(8):
+            submission.save()
+
+    def test_stale_copies_do_not_double_shift(self):
+        first = Submission.objects.get(competition=self.competition, user=self.users[4])
+        second = Submission.objects.get(pk=first.pk)
+        first.score = 80
+        first.save()
+        # Loaded before the first rescore: shifts from 80, not from the 10 it was loaded with
+        second.score = 80
+        second.save()
+        self.assertRanksCorrect()
+
+    def test_failed_shift_rolls_back_the_score(self):
+        submission = Submission.objects.get(competition=self.competition, user=self.users[4])
+        submission.score = 80
+        with mock.patch.object(Competition, 'shift_ranks', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                submission.save()
+        self.assertEqual(Submission.objects.get(pk=submission.pk).score, 10)
+        self.assertRanksCorrect()
+
+    def test_deleting_moves_lower_ranks_up(self):
+        Submission.objects.get(competition=self.competition, user=self.users[3]).delete()
+        self.assertRanksCorrect()
+
+    def test_unranked_rows_fall_back_to_recompute(self):
+        self.competition.submissions.update(rank=None)
+        self.rescore(0, 95)
+        self.assertRanksCorrect()
+
+    def test_score_view(self):
+        self.client.force_login(self.admin)
+        submission = Submission.objects.get(competition=self.competition, user=self.users[6])
+        self.client.post(reverse('competitions:score_submission', args=[submission.pk]), {'score': 75, 'feedback': ''})
+        submission.refresh_from_db()
+        self.assertEqual(submission.rank, 3)
+        self.assertRanksCorrect()
+
+
+class LeaderboardCacheTests(TestCase):
+    """Leaderboard snapshots are served from the cache until scoring changes the order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', role='admin')
+        cls.competition = Competition.objects.create(
+            title='Contest', description='', start_date=now, end_date=now + timedelta(days=1), created_by=cls.admin,
+        )
+        cls.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass') for i in range(3)]
+        for user, score in zip(cls.users, [50, 90, 70]):
+            Submission.objects.create(competition=cls.competition, user=user, solution='...', score=score)
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self):
+        return [entry.username for entry in leaderboard_page(self.competition, 1, 10).entries]
+
+    def test_snapshot_is_reused_until_the_order_changes(self):
+        self.assertEqual(self.names(), ['user1', 'user2', 'user0'])
+        self.assertEqual(leaderboard_entry(self.competition, self.admin), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ['user1', 'user2', 'user0'])
+            self.assertEqual(leaderboard_entry(self.competition, self.admin), None)
+
+        # Feedback alone leaves the order, and the snapshot, alone
+        version = leaderboard_version(self.competition.pk)
+        submission = Submission.objects.get(competition=self.competition, user=self.users[0])
+        submission.feedback = 'Nice'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            submission.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(leaderboard_version(self.competition.pk), version)
+
+        submission.score = 100
+        with self.captureOnCommitCallbacks(execute=True):
+            submission.save()
+        self.assertNotEqual(leaderboard_version(self.competition.pk), version)
+        self.assertEqual(self.names(), ['user0', 'user1', 'user2'])
+        self.assertEqual(leaderboard_entry(self.competition, self.users[0]).position, 1)
+
+    def test_waiters_share_one_rebuild(self):
+        cache.add('test-key:lock', 1)
+        threading.Timer(0.1, lambda: cache.set('test-key', 'built elsewhere')).start()
+        build = mock.Mock(return_value='built here')
+        self.assertEqual(single_flight('test-key', build), 'built elsewhere')
+        build.assert_not_called()
+
+    def test_pages_past_the_end_are_not_cached(self):
+        self.assertEqual(leaderboard_page(self.competition, 99999, 10).entries, ())
+        self.assertEqual(leaderboard_page(self.competition, 1, 10).entries[0].username, 'user1')
+        version = leaderboard_version(self.competition.pk)
+        self.assertIsNone(cache.get(f'competitions:leaderboard:{self.competition.pk}:{version}:10:99999'))
+        self.assertIsNotNone(cache.get(f'competitions:leaderboard:{self.competition.pk}:{version}:10:1'))
+        # The first page is kept even when empty, so an empty leaderboard is still served from the cache
+        Submission.objects.filter(competition=self.competition).delete()
+        bump_leaderboard(self.competition.pk)
+        leaderboard_page(self.competition, 1, 10)
+        with self.assertNumQueries(0):
+            self.assertEqual(leaderboard_page(self.competition, 1, 10).entries, ())
+
+    def test_waiters_stop_polling_once_the_lock_is_released(self):
+        cache.add('test-key:lock', 1)
+        threading.Timer(0.1, lambda: cache.delete('test-key:lock')).start()
+        start = time.monotonic()
+        self.assertEqual(single_flight('test-key', lambda: 'built here'), 'built here')
+        self.assertLess(time.monotonic() - start, REBUILD_WAIT)
+
+
+class CompetitionCountTests(TestCase):
+    """Participant and problem counts come annotated on the competitions query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.admin = User.objects.create_user(
+            'admin', 'admin@example.com', 'pass', role='admin', is_staff=True, is_superuser=True,
+        )
+        cls.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass') for i in range(3)]
+        cls.competitions = [
+            Competition.objects.create(
+                title=f'Contest {i}', description='', start_date=now - timedelta(days=i),
+                end_date=now + timedelta(days=1), created_by=cls.admin,
+            )
+            for i in range(3)
+        ]
+        for user in cls.users:
+            Submission.objects.create(competition=cls.competitions[0], user=user, solution='...')
+        Submission.objects.create(competition=cls.competitions[1], user=cls.users[0], solution='...')
+        for order in range(2):
+            Problem.objects.create(competition=cls.competitions[0], title=f'P{order}', description='', order=order)
+
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = [(c.participant_count, c.problem_count) for c in Competition.objects.with_counts()]
+        self.assertEqual(counts, [(3, 2), (1, 0), (0, 0)])
+
+    def test_list_paginates(self):
+        self.client.force_login(self.users[0])
+        with mock.patch('competitions.views.COMPETITION_PAGE_SIZE', 2):
+            first = self.client.get(reverse('competitions:list'))
+            second = self.client.get(reverse('competitions:list'), {'page': 2})
+            invalid = self.client.get(reverse('competitions:list'), {'page': 'last'})
+        self.assertEqual([c.title for c in first.context['competitions']], ['Contest 0', 'Contest 1'])
+        self.assertTrue(first.context['has_next'])
+        self.assertEqual([c.title for c in second.context['competitions']], ['Contest 2'])
+        self.assertFalse(second.context['has_next'])
+        self.assertEqual(invalid.context['page'], 1)
+
+    def test_detail_and_admin_use_the_annotation(self):
+        self.client.force_login(self.users[0])
+        response = self.client.get(reverse('competitions:detail', args=[self.competitions[0].pk]))
+        self.assertEqual(response.context['competition'].participant_count, 3)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:competitions_competition_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(c.participant_count for c in response.context['cl'].result_list), [0, 1, 3],
+        )
+
+
+class LifecycleTests(TestCase):
+    """Status follows the dates, moved on in bulk by the scheduler"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', role='admin')
+        cls.user = User.objects.create_user('user', 'user@example.com', 'pass')
+
+        def create(title, start, end):
+            return Competition.objects.create(
+                title=title, description='', start_date=now + start, end_date=now + end, created_by=cls.admin,
+            )
+        cls.upcoming = create('Upcoming', timedelta(days=1), timedelta(days=2))
+        cls.active = create('Active', -timedelta(days=1), timedelta(days=1))
+        cls.completed = create('Completed', -timedelta(days=2), -timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_status_is_derived_on_save(self):
+        self.assertEqual(
+            [self.upcoming.status, self.active.status, self.completed.status], ['upcoming', 'active', 'completed'],
+        )
+        self.upcoming.start_date = timezone.now() - timedelta(hours=1)
+        self.upcoming.save()
+        self.assertEqual(Competition.objects.get(pk=self.upcoming.pk).status, 'active')
+
+    def test_advance_status_moves_due_competitions(self):
+        now = timezone.now()
+        # Dates moved without save(), as time passing would
+        Competition.objects.filter(pk=self.upcoming.pk).update(start_date=now - timedelta(minutes=1))
+        Competition.objects.filter(pk=self.active.pk).update(end_date=now - timedelta(minutes=1))
+        for score, user in zip([10, 30], [self.admin, self.user]):
+            Submission.objects.create(competition=self.active, user=user, solution='...', score=score)
+        Submission.objects.filter(competition=self.active).update(rank=None)
+        version = leaderboard_version(self.active.pk)
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            changed = Competition.objects.advance_status(now)
+        # One bulk UPDATE per transition
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "competitions_competition"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(changed, {'completed': [self.active.pk], 'active': [self.upcoming.pk]})
+        self.assertEqual(Competition.objects.advance_status(now), {})
+
+        # Closing settled the final ranks and retired the leaderboard snapshot
+        self.assertEqual(
+            list(Submission.objects.filter(competition=self.active).values_list('user__username', 'rank')),
+            [('user', 1), ('admin', 2)],
+        )
+        self.assertNotEqual(leaderboard_version(self.active.pk), version)
+
+    def test_submissions_only_while_active(self):
+        self.client.force_login(self.user)
+        for competition in (self.upcoming, self.completed):
+            response = self.client.post(reverse('competitions:submit', args=[competition.pk]), {'solution': 'late'})
+            self.assertRedirects(response, reverse('competitions:detail', args=[competition.pk]))
+        self.assertFalse(Submission.objects.exists())
+
+        self.client.post(reverse('competitions:submit', args=[self.active.pk]), {'solution': 'on time'})
+        self.assertTrue(Submission.objects.filter(competition=self.active, user=self.user).exists())
+
+    def test_close_now_and_reopen(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.active.close_now()
+        self.assertEqual(Competition.objects.get(pk=self.active.pk).status, 'completed')
+
+        # Reopening is moving the end back into the future
+        self.active.end_date = timezone.now() + timedelta(days=1)
+        self.active.save()
+        self.assertEqual(Competition.objects.get(pk=self.active.pk).status, 'active')
+
+    def test_command_runs_once(self):
+        Competition.objects.filter(pk=self.upcoming.pk).update(start_date=timezone.now())
+        out = StringIO()
+        call_command('advance_competitions', interval=0, stdout=out)
+        self.assertEqual(out.getvalue(), '1 competition now active\n')
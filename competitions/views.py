@@ -4,6 +4,11 @@ from django.contrib import messages
 from django.utils import timezone
 from .models import Competition, Problem, Submission
 from .forms import CompetitionForm, ProblemForm, SubmissionForm, ScoreForm
+from .leaderboard import leaderboard_entry, leaderboard_page
+from .pagination import fetch_page, page_number
+
+LEADERBOARD_PAGE_SIZE = 50
+COMPETITION_PAGE_SIZE = 12
 
 def admin_required(view_func):
     """Decorator to check if user is admin"""
@@ -20,14 +25,22 @@ def admin_required(view_func):
 @login_required
 def competition_list(request):
     """List all competitions"""
-    competitions = Competition.objects.all()
-    context = {'competitions': competitions}
+    page = page_number(request)
+    competitions, has_next = fetch_page(
+        lambda limit, offset: Competition.objects.with_counts()[offset:offset + limit], page, COMPETITION_PAGE_SIZE,
+    )
+    
+    context = {
+        'competitions': competitions,
+        'page': page,
+        'has_next': has_next,
+    }
     return render(request, 'competitions/list.html', context)
 
 @login_required
 def competition_detail(request, pk):
     """View competition details and problems"""
-    competition = get_object_or_404(Competition, pk=pk)
+    competition = get_object_or_404(Competition.objects.with_counts(), pk=pk)
     problems = competition.problems.all()
     
     # Check if user has submitted
@@ -49,11 +62,17 @@ def competition_detail(request, pk):
 def competition_leaderboard(request, pk):
     """View competition leaderboard"""
     competition = get_object_or_404(Competition, pk=pk)
-    leaderboard = competition.leaderboard
+    page = page_number(request)
+    
+    # Served from the cached snapshot, rebuilt only after scoring changed the order
+    leaderboard = leaderboard_page(competition, page, LEADERBOARD_PAGE_SIZE)
     
     context = {
         'competition': competition,
-        'leaderboard': leaderboard,
+        'leaderboard': leaderboard.entries,
+        'my_entry': leaderboard_entry(competition, request.user),
+        'page': page,
+        'has_next': leaderboard.has_next,
     }
     return render(request, 'competitions/leaderboard.html', context)
 
@@ -124,6 +143,11 @@ def submit_solution(request, pk):
     """Submit solution for competition"""
     competition = get_object_or_404(Competition, pk=pk)
     
+    # The scheduler opens and closes submissions by moving the status on
+    if competition.status != 'active':
+        messages.error(request, 'This competition is not accepting submissions.')
+        return redirect('competitions:detail', pk=pk)
+    
     # Check if already submitted
     existing_submission = Submission.objects.filter(competition=competition, user=request.user).first()
     
@@ -181,10 +205,9 @@ def score_submission(request, pk):
             submission = form.save(commit=False)
             submission.scored_by = request.user
             submission.scored_at = timezone.now()
-            submission.save()
-            
-            # Update ranks
-            update_competition_ranks(submission.competition)
+            # Saving the score shifts the stored ranks of the scores it passed over, in the
+            # same transaction. The rank itself is left to that, so a stale copy is never written back
+            submission.save(update_fields=['score', 'feedback', 'scored_by', 'scored_at'])
             
             messages.success(request, 'Submission scored successfully!')
             return redirect('competitions:submissions', pk=submission.competition.pk)
@@ -196,16 +219,3 @@ def score_submission(request, pk):
         'submission': submission,
     }
     return render(request, 'competitions/score.html', context)
-
-def update_competition_ranks(competition):
-    """Update ranks for all submissions in a competition"""
-    submissions = list(competition.submissions.order_by('-score', 'submitted_at'))
-    
-    current_rank = 1
-    for i, submission in enumerate(submissions):
-        submission.rank = current_rank
-        submission.save(update_fields=['rank'])
-        
-        # If next submission has different score, increment rank
-        if i + 1 < len(submissions) and submissions[i + 1].score < submission.score:
-            current_rank = i + 2
\ No newline at end of file
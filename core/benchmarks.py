@@ -0,0 +1,51 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from django.db import connections
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextmanager
+def benchmark_database(verbosity=0, on_disk=False):
+    """Run a benchmark against throwaway test databases, never the real ones
+
+    Every database alias gets its own test database. SQLite test databases live
+    in memory unless ``on_disk`` is set, which benchmarks that depend on file
+    locking between connections need.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='bench-') if on_disk else None
+    if tmpdir:
+        for alias in connections:
+            connections[alias].settings_dict['TEST']['NAME'] = os.path.join(tmpdir, f'{alias}.sqlite3')
+
+    old_config = setup_databases(verbosity, interactive=False, serialized_aliases=set())
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity)
+        if tmpdir:
+            for alias in connections:
+                connections[alias].settings_dict['TEST']['NAME'] = None
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def time_call(func, repeat=5):
+    """Best wall-clock time of ``func`` over ``repeat`` runs, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def latency_percentiles(samples):
+    """Median and 95th percentile of timings in milliseconds"""
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value
+    cuts = statistics.quantiles(samples, n=20)
+    return statistics.median(samples), cuts[18]
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose incr is a read followed by a write, so concurrent increments get lost
+NON_ATOMIC_INCR_CACHES = {
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+}
+
+
+@register(deploy=True)
+def check_atomic_incr_cache(app_configs, **kwargs):
+    """Rate limit counters are shared through cache.incr, which has to be atomic"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.RATE_LIMITS and backend in NON_ATOMIC_INCR_CACHES:
+        return [Warning(
+            'The default cache cannot increment atomically, so concurrent requests '
+            'lose counts and a burst gets past the rate limits.',
+            hint='Point CACHES["default"] at Redis or Memcached.',
+            id='core.W001',
+        )]
+    return []
@@ -0,0 +1,27 @@
+import threading
+
+# Past this many keys the state is dropped wholesale; it only saves cache round trips
+LOCAL_STATE_LIMIT = 10000
+
+
+class LocalState:
+    """A per-process, thread-safe memo kept in front of the shared cache
+
+    Losing an entry only costs a cache round trip, so instead of tracking age
+    the whole memo is emptied once it holds ``limit`` keys.
+    """
+
+    def __init__(self, limit=LOCAL_STATE_LIMIT):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._entries.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.limit:
+                self._entries.clear()
+            self._entries[key] = value
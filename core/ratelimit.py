@@ -0,0 +1,130 @@
+import math
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from .localstate import LocalState
+
+
+class SlidingWindowLimiter:
+    """Sliding window request counter shared by every worker process through the cache
+
+    Counts live in fixed buckets of ``window`` seconds. A request is allowed while
+    the previous bucket's count, weighted by how much of it still overlaps the
+    sliding window, plus the current bucket's count stays within ``limit``.
+
+    Each process remembers the previous bucket's final count and the last count
+    it saw in the current bucket. An allowed request costs a cache add and incr,
+    plus a get of the previous bucket on a client's first request in a bucket,
+    and a client already over budget is turned away without touching the cache.
+
+    Counts are exact on a cache with an atomic incr, such as Redis or Memcached.
+    The file-based cache can lose concurrent increments, which lets a burst
+    overshoot the limit; the core.W001 deploy check flags it.
+    """
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self._local = LocalState()
+
+    def key(self, ident, bucket):
+        return f'ratelimit:{self.scope}:{ident}:{bucket}'
+
+    def hit(self, ident, now=None):
+        """Count a request; returns None if allowed, else seconds until the client may retry"""
+        now = time.time() if now is None else now
+        bucket, elapsed = divmod(now, self.window)
+        bucket = int(bucket)
+        weight = 1 - elapsed / self.window
+
+        state = self._local.get(ident)
+        if state and state[0] == bucket:
+            _, previous, seen = state
+            # Counts only grow within a bucket, so this estimate is a lower bound
+            if previous * weight + seen >= self.limit:
+                return self.retry_after(previous, seen, elapsed)
+        else:
+            previous = None
+
+        key = self.key(ident, bucket)
+        cache.add(key, 0, self.window * 2)
+        try:
+            current = cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(key, 1, self.window * 2)
+            current = 1
+        if previous is None:
+            previous = cache.get(self.key(ident, bucket - 1), 0)
+
+        self._local.set(ident, (bucket, previous, current))
+
+        if previous * weight + current > self.limit:
+            return self.retry_after(previous, current, elapsed)
+        return None
+
+    def retry_after(self, previous, current, elapsed):
+        """Seconds until one more request fits under the limit"""
+        if current < self.limit:
+            # Wait for enough of the previous bucket to slide out of the window:
+            # previous * (1 - e / window) + current + 1 <= limit
+            overlap = (self.limit - current - 1) / previous
+            wait = self.window * (1 - overlap) - elapsed
+        else:
+            # The current bucket alone is full: wait for it to become the previous
+            # bucket and slide far enough out, current * (1 - e / window) + 1 <= limit
+            wait = self.window - elapsed + self.window * (1 - (self.limit - 1) / current)
+        return max(1, math.ceil(wait))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(scope):
+    """The limiter for a scope with its budget from settings.RATE_LIMITS, or None if unlimited"""
+    budget = settings.RATE_LIMITS.get(scope)
+    if budget is None:
+        return None
+    limit, window = budget
+    with _limiters_lock:
+        limiter = _limiters.get(scope)
+        if limiter is None or (limiter.limit, limiter.window) != (limit, window):
+            limiter = _limiters[scope] = SlidingWindowLimiter(scope, limit, window)
+    return limiter
+
+
+def client_ident(request):
+    """Rate limit signed-in users by account and everyone else by address"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def rate_limit(scope):
+    """Limit a view to the budget configured for ``scope`` in settings.RATE_LIMITS
+
+    Requests over budget get 429 Too Many Requests with a Retry-After header.
+    Allowed requests only touch the cache, never the database.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            limiter = get_limiter(scope)
+            if limiter:
+                retry_after = limiter.hit(client_ident(request))
+                if retry_after:
+                    response = HttpResponse(
+                        f'Too many requests. Try again in {retry_after} seconds.',
+                        status=429,
+                        content_type='text/plain',
+                    )
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,3 +1,73 @@
-from django.test import TestCase
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from .checks import check_atomic_incr_cache
+from .ratelimit import SlidingWindowLimiter
 
-# Create your tests here.
+
+class SlidingWindowLimiterTests(SimpleTestCase):
+    """Counts are weighted across two fixed buckets and shared through the cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.limiter = SlidingWindowLimiter('test', limit=5, window=60)
+
+    def test_allows_up_to_limit_then_denies(self):
+        for _ in range(5):
+            self.assertIsNone(self.limiter.hit('a', now=6000))
+        # Into the next bucket far enough that 5 * (1 - e / 60) + 1 <= 5
+        self.assertEqual(self.limiter.hit('a', now=6010), 60 - 10 + 12)
+        # Other clients have their own budget
+        self.assertIsNone(self.limiter.hit('b', now=6010))
+
+    def test_retry_after_is_long_enough(self):
+        for _ in range(5):
+            self.limiter.hit('a', now=6000)
+        retry_after = self.limiter.hit('a', now=6010)
+        self.assertIsNone(self.limiter.hit('a', now=6010 + retry_after))
+
+        # Denied while the previous bucket still weighs in, then allowed at the returned time
+        for _ in range(5):
+            self.limiter.hit('c', now=6050)
+        retry_after = self.limiter.hit('c', now=6070)
+        self.assertIsNotNone(retry_after)
+        self.assertIsNone(self.limiter.hit('c', now=6070 + retry_after))
+
+    def test_previous_bucket_slides_out(self):
+        for _ in range(5):
+            self.limiter.hit('a', now=6050)
+        # Just into the next bucket nearly all of the old count still weighs in
+        self.assertIsNotNone(self.limiter.hit('a', now=6062))
+        self.assertIsNone(SlidingWindowLimiter('test', 5, 60).hit('a', now=6110))
+
+    def test_shared_between_processes(self):
+        other = SlidingWindowLimiter('test', limit=5, window=60)
+        for _ in range(3):
+            self.limiter.hit('a', now=6000)
+        for _ in range(2):
+            self.assertIsNone(other.hit('a', now=6000))
+        self.assertIsNotNone(other.hit('a', now=6000))
+
+    def test_over_budget_skips_cache(self):
+        for _ in range(6):
+            self.limiter.hit('a', now=6000)
+        with mock.patch('core.ratelimit.cache') as shared:
+            self.assertIsNotNone(self.limiter.hit('a', now=6001))
+        self.assertFalse(shared.method_calls)
+
+
+    def test_deploy_check_wants_an_atomic_incr(self):
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/cache'}
+        with override_settings(CACHES={'default': shared}):
+            self.assertEqual([warning.id for warning in check_atomic_incr_cache(None)], ['core.W001'])
+        redis = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}
+        with override_settings(CACHES={'default': redis}):
+            self.assertEqual(check_atomic_incr_cache(None), [])
+
+
+class TestCacheTests(SimpleTestCase):
+    """Tests never clear the site's file-based cache"""
+
+    def test_tests_use_a_private_cache(self):
+        self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
@@ -1,18 +1,76 @@
 from django.contrib import admin
-from .models import Conversation, Message, FirstContactTracker
+from django.db.models import Q
+from accounts.models import User
+from .models import Conversation, Message, FirstContactTracker, ChatGroup, ChatMembership
+from .search import fts_match_ids
+
+
+class MessagingAdmin(admin.ModelAdmin):
+    """Admin for models in the messaging database
+
+    Users live in the default database, so user columns are prefetched and
+    username search resolves matching user ids first instead of joining.
+    ``search_fields`` still name the username lookups to document what is searched.
+    """
+    user_fields = ()
+    # No automatic select_related: it would join accounts_user, which is not in this database
+    list_select_related = ()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(*self.user_fields)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        user_ids = list(User.objects.filter(username__icontains=search_term).values_list('pk', flat=True))
+        condition = Q()
+        for field in self.user_fields:
+            condition |= Q(**{f'{field}__in': user_ids})
+        return queryset.filter(condition), False
+
 
 @admin.register(Conversation)
-class ConversationAdmin(admin.ModelAdmin):
-    list_display = ('user1', 'user2', 'created_at', 'updated_at')
+class ConversationAdmin(MessagingAdmin):
+    list_display = ('user1', 'user2', 'user1_last_read_id', 'user2_last_read_id', 'last_message_at', 'created_at')
     search_fields = ('user1__username', 'user2__username')
+    user_fields = ('user1', 'user2')
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
-    list_display = ('sender', 'receiver', 'is_group_message', 'group_type', 'is_read', 'created_at')
-    list_filter = ('is_group_message', 'is_read', 'created_at')
-    search_fields = ('sender__username', 'receiver__username', 'content')
+class MessageAdmin(MessagingAdmin):
+    list_display = ('sender', 'receiver', 'is_group_message', 'group', 'created_at')
+    list_select_related = ('group',)
+    list_filter = ('is_group_message', 'created_at')
+    search_fields = ('sender__username', 'receiver__username')
+    user_fields = ('sender', 'receiver')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Match content through the full-text index instead of a LIKE scan"""
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            results |= queryset.filter(id__in=fts_match_ids(search_term))
+        return results, may_have_duplicates
 
 @admin.register(FirstContactTracker)
-class FirstContactTrackerAdmin(admin.ModelAdmin):
+class FirstContactTrackerAdmin(MessagingAdmin):
     list_display = ('sender', 'receiver', 'message_count', 'receiver_replied', 'created_at')
-    list_filter = ('receiver_replied',)
\ No newline at end of file
+    list_filter = ('receiver_replied',)
+    search_fields = ('sender__username', 'receiver__username')
+    user_fields = ('sender', 'receiver')
+
+@admin.register(ChatGroup)
+class ChatGroupAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'audience', 'school', 'created_at')
+    list_filter = ('audience',)
+    search_fields = ('name', 'slug', 'school')
+    prepopulated_fields = {'slug': ('name',)}
+    raw_id_fields = ('competition',)
+
+@admin.register(ChatMembership)
+class ChatMembershipAdmin(MessagingAdmin):
+    list_display = ('user', 'group', 'last_read_id', 'joined_at')
+    list_filter = ('group',)
+    list_select_related = ('group',)
+    search_fields = ('user__username',)
+    user_fields = ('user',)
+    raw_id_fields = ('user',)
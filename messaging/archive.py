@@ -0,0 +1,110 @@
+import zlib
+from django.db import connections, transaction
+from .pagination import encode_cursor, keyset_page
+
+COMPRESSION_LEVEL = 6
+
+
+def compress(text):
+    return zlib.compress(text.encode(), COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(data).decode()
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to ``batch_size`` of the oldest messages sent before ``cutoff`` into the archive
+
+    One short transaction per batch. The newest message always stays live: SQLite
+    hands out max(id) + 1 as the next id, so an emptied table would reuse ids that
+    read cursors and the archive still refer to. Returns the number moved.
+    """
+    from .models import ArchivedMessage, Message
+
+    with transaction.atomic(using=Message.objects.db):
+        newest_id = Message.objects.order_by('-id').values_list('id', flat=True).first()
+        if newest_id is None:
+            return 0
+        rows = list(Message.objects.filter(created_at__lt=cutoff, id__lt=newest_id).order_by('id').values(
+            'id', 'conversation_id', 'sender_id', 'receiver_id', 'content', 'created_at',
+            'is_group_message', 'group_id',
+        )[:batch_size])
+        if not rows:
+            return 0
+
+        ArchivedMessage.objects.bulk_create([
+            ArchivedMessage(compressed_content=compress(row.pop('content')), **row)
+            for row in rows
+        ])
+        Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def vacuum_mode(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum')
+        return cursor.fetchone()[0]
+
+
+def enable_incremental_vacuum(alias):
+    """Switch a SQLite database to incremental auto-vacuum; returns whether it changed
+
+    Takes one full VACUUM, which rewrites the whole file under an exclusive lock,
+    so it is run on purpose (archive_messages --enable-incremental-vacuum), never
+    as a side effect of archiving.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'sqlite' or vacuum_mode(connection) == 2:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+    return True
+
+
+def incremental_vacuum(alias, pages):
+    """Hand free pages back to the file system, ``pages`` at a time; returns pages freed
+
+    Does nothing until enable_incremental_vacuum has run. SQLite only, and
+    skipped inside a transaction.
+    """
+    connection = connections[alias]
+    # VACUUM cannot run inside a transaction
+    if connection.vendor != 'sqlite' or connection.in_atomic_block or vacuum_mode(connection) != 2:
+        return 0
+
+    freed = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute('PRAGMA freelist_count')
+            free = cursor.fetchone()[0]
+            if not free:
+                return freed
+            # The pragma frees one page per step; executescript steps it to the end
+            connection.connection.executescript(f'PRAGMA incremental_vacuum({min(free, pages)})')
+            freed += min(free, pages)
+
+
+def history_page(live, archived, cursor, size):
+    """keyset_page over live messages, continued into the archive once they run out
+
+    Archiving moves the oldest messages, so the archive only holds messages older
+    than anything still live and the same cursor works across both.
+    """
+    items, next_cursor = keyset_page(live, cursor, size)
+    if next_cursor:
+        return items, next_cursor
+
+    # Position of the oldest live message on this page, or where the page started
+    if items:
+        cursor = (items[0].created_at, items[0].pk)
+    remaining = size - len(items)
+    if remaining:
+        older, next_cursor = keyset_page(archived, cursor, remaining)
+        return older + items, next_cursor
+
+    # A full page of live messages: only point further back if the archive has more
+    if keyset_page(archived, cursor, 1)[0]:
+        next_cursor = encode_cursor(*cursor)
+    return items, next_cursor
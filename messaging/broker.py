@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+
+class Subscription:
+    """A subscriber's queue of events for a set of channels"""
+
+    def __init__(self, broker, channels, loop, max_size):
+        self.broker = broker
+        self.channels = list(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_size)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client: drop the event, the polling fallback will catch it up
+            pass
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class MessageBroker:
+    """In-process publish/subscribe hub for live chat events
+
+    Streaming responses subscribe with an asyncio queue. Publishing is thread-safe,
+    so sync views running in the ASGI thread pool can call it directly. Events only
+    reach subscribers in the same process; clients keep polling as a fallback.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channels):
+        """Subscribe the running event loop to channels"""
+        subscription = Subscription(self, channels, asyncio.get_running_loop(), self.max_queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, event):
+        """Send an event to every subscriber of a channel"""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Event loop already closed; the stream is gone
+                subscription.close()
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def group_channel(group_id):
+    return f'group:{group_id}'
+
+
+broker = MessageBroker()
@@ -0,0 +1,70 @@
+from typing import NamedTuple
+from django.core.cache import cache
+from .mailbox import new_version
+
+GROUP_ACCESS_CACHE_TIMEOUT = 300
+GROUP_GENERATION_KEY = 'messaging:group-generation'
+
+
+class GroupRef(NamedTuple):
+    """What views need to know about a group chat"""
+
+    id: int
+    slug: str
+    name: str
+    audience: str
+
+
+class GroupAccess(NamedTuple):
+    """Group chats one user can read"""
+
+    generation: str
+    is_admin: bool
+    groups: tuple
+
+    @property
+    def ids(self):
+        return [group.id for group in self.groups]
+
+    def get(self, slug):
+        """The readable group with this slug, or None"""
+        return next((group for group in self.groups if group.slug == slug), None)
+
+
+def group_access_key(user_id):
+    return f'messaging:group-access:{user_id}'
+
+
+def get_group_access(user):
+    """Load the group chats a user can read once and serve them from the cache
+
+    The user's entry is read together with the group generation in one cache
+    round trip. Any change to a group bumps the generation, and a change of role
+    shows up in ``is_admin``, so either one makes the entry stale.
+    """
+    from .models import ChatGroup
+
+    key = group_access_key(user.pk)
+    cached = cache.get_many([key, GROUP_GENERATION_KEY])
+    generation = cached.get(GROUP_GENERATION_KEY)
+    if generation is None:
+        generation = bump_group_generation()
+
+    access = cached.get(key)
+    if access is None or access.generation != generation or access.is_admin != user.is_admin:
+        groups = ChatGroup.objects.readable_by(user).values_list('id', 'slug', 'name', 'audience')
+        access = GroupAccess(generation, user.is_admin, tuple(GroupRef(*row) for row in groups))
+        cache.set(key, access, GROUP_ACCESS_CACHE_TIMEOUT)
+    return access
+
+
+def invalidate_group_access(*user_ids):
+    """Drop the cached group access of users whose memberships changed"""
+    cache.delete_many([group_access_key(user_id) for user_id in user_ids])
+
+
+def bump_group_generation():
+    """Mark every cached group access as stale, after a group itself changed"""
+    generation = new_version()
+    cache.set(GROUP_GENERATION_KEY, generation, None)
+    return generation
@@ -0,0 +1,44 @@
+import hashlib
+import time
+from django.core.cache import cache
+
+
+def mailbox_key(user_id):
+    return f'messaging:mailbox:{user_id}'
+
+
+def group_key(group_id):
+    return f'messaging:group-version:{group_id}'
+
+
+def new_version():
+    # Any fresh value works: clients only compare versions for equality
+    return format(time.time_ns(), 'x')
+
+
+def bump_mailbox(*user_ids):
+    """Mark the users' mailboxes as changed (new message or read cursor moved)"""
+    version = new_version()
+    cache.set_many({mailbox_key(user_id): version for user_id in user_ids}, None)
+
+
+def bump_group(group_id):
+    """Mark a group chat as changed"""
+    cache.set(group_key(group_id), new_version(), None)
+
+
+def mailbox_etag(user, group_ids, extra=''):
+    """ETag over the user's mailbox version and the versions of their groups
+    
+    Reads only the cache. A version missing from the cache (never set or evicted)
+    is replaced with a fresh one, so a lost version can never match an old ETag.
+    """
+    keys = [mailbox_key(user.pk)] + [group_key(group_id) for group_id in group_ids]
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    
+    raw = '|'.join([str(user.pk), extra] + [versions[key] for key in keys])
+    return hashlib.md5(raw.encode()).hexdigest()
@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from messaging.archive import archive_batch, enable_incremental_vacuum, incremental_vacuum
+from messaging.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Move old messages into the compressed archive in small batches, then reclaim the freed space'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MESSAGING_ARCHIVE_AFTER_DAYS,
+                            help='Archive messages older than this many days')
+        parser.add_argument('--batch-size', type=int, default=settings.MESSAGING_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds between batches, so chat writes get the lock in between')
+        parser.add_argument('--vacuum-pages', type=int, default=1000,
+                            help='Free pages handed back per incremental vacuum step')
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help='First switch the database to incremental auto-vacuum (one full VACUUM)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, archiving every this many seconds (0 runs once)')
+
+    def handle(self, *args, **options):
+        if options['enable_incremental_vacuum']:
+            if enable_incremental_vacuum(Message.objects.db):
+                self.stdout.write('Switched to incremental auto-vacuum')
+            else:
+                self.stdout.write('Incremental auto-vacuum already enabled')
+        while True:
+            self.run(options)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def run(self, options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        archived = 0
+        while True:
+            moved = archive_batch(cutoff, options['batch_size'])
+            archived += moved
+            if moved < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+
+        freed = incremental_vacuum(Message.objects.db, options['vacuum_pages']) if archived else 0
+        self.stdout.write(f'Archived {archived} messages older than {cutoff:%Y-%m-%d}, freed {freed} pages')
@@ -0,0 +1,124 @@
+import threading
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.utils import timezone
+from accounts.models import User
+from competitions.models import Competition, Submission
+from core.benchmarks import benchmark_database, latency_percentiles
+from messaging.models import ChatGroup, Conversation, Message
+
+
+class ChatStorm:
+    """Writer threads inserting group chat messages as fast as they can"""
+
+    def __init__(self, alias, sender, writers):
+        self.alias = alias
+        self.sender = sender
+        self.writers = writers
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+        self.threads = []
+
+    def write(self):
+        try:
+            while not self.stop.is_set():
+                try:
+                    Message.objects.using(self.alias).create(
+                        sender_id=self.sender.pk,
+                        content='Storm message',
+                        is_group_message=True,
+                    )
+                    with self.lock:
+                        self.written += 1
+                except OperationalError:
+                    with self.lock:
+                        self.errors += 1
+        finally:
+            connections.close_all()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.threads = [threading.Thread(target=self.write) for _ in range(self.writers)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+
+class Command(BaseCommand):
+    help = 'Benchmark submission scoring latency while the chat takes a burst of writes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=50)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--samples', type=int, default=30)
+
+    def handle(self, *args, **options):
+        # File-backed databases: the storm is about SQLite's per-file write lock
+        with benchmark_database(on_disk=True):
+            admin, submissions = self.seed(options['participants'])
+
+            # What chat writes did before the split: the same tables in the main database
+            with connections['default'].schema_editor() as editor:
+                editor.create_model(Conversation)
+                editor.create_model(ChatGroup)
+                editor.create_model(Message)
+
+            self.stdout.write(f"{'scenario':<28} {'p50':>9} {'p95':>9} {'errors':>7} {'chat writes/s':>14}")
+            self.report('idle', self.score(admin, submissions, options['samples']))
+            for label, alias in [('storm, shared database', 'default'), ('storm, messaging database', 'messaging')]:
+                with ChatStorm(alias, admin, options['writers']) as storm:
+                    timings = self.score(admin, submissions, options['samples'])
+                self.report(label, timings, storm)
+
+    def seed(self, participants):
+        admin = User.objects.create_user('bench_admin', 'admin@bench.local', 'pass', is_staff=True)
+        competition = Competition.objects.create(
+            title='Storm benchmark',
+            description='Scoring under chat load',
+            start_date=timezone.now() - timedelta(days=1),
+            end_date=timezone.now() + timedelta(days=1),
+            status='active',
+            created_by=admin,
+        )
+        submissions = []
+        for i in range(participants):
+            user = User.objects.create_user(f'bench_user_{i}', f'user{i}@bench.local', 'pass')
+            submissions.append(Submission.objects.create(competition=competition, user=user, solution='print(1)'))
+        return admin, submissions
+
+    def score(self, admin, submissions, samples):
+        """Time the score_submission view's writes: saving the score also shifts the ranks"""
+        timings = []
+        errors = 0
+        for i in range(samples):
+            submission = submissions[i % len(submissions)]
+            submission.score = (submission.score + 7) % 100
+            submission.scored_by = admin
+            submission.scored_at = timezone.now()
+
+            start = time.perf_counter()
+            try:
+                submission.save()
+            except OperationalError:
+                errors += 1
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings, errors
+
+    def report(self, label, result, storm=None):
+        timings, errors = result
+        p50, p95 = latency_percentiles(timings)
+        rate = f'{storm.written / storm.elapsed:.0f}' if storm else '-'
+        if storm and storm.errors:
+            rate += f' ({storm.errors} failed)'
+        self.stdout.write(f'{label:<28} {p50:>7.1f}ms {p95:>7.1f}ms {errors:>7} {rate:>14}')
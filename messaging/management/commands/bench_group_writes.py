@@ -0,0 +1,55 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from accounts.models import User
+from core.benchmarks import benchmark_database
+from messaging.batching import MessageBatcher
+from messaging.models import ChatGroup, Message
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sustained group message inserts per second with and without write-behind batching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=16, help='Concurrent senders')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run')
+        parser.add_argument('--window', type=float, default=0.005, help='Batch window in seconds')
+
+    def handle(self, *args, **options):
+        # File-backed databases: batching is about paying for fewer commits and fsyncs
+        with benchmark_database(on_disk=True):
+            sender = User.objects.create_user('bench_sender', 'sender@bench.local', 'pass')
+            group = ChatGroup.objects.get(slug='all')
+            batcher = MessageBatcher(window=options['window'])
+
+            self.stdout.write(f"{'write path':<12} {'inserts/s':>10} {'commits':>8} {'avg batch':>10}")
+            for label, save in [('direct', lambda message: message.save()), ('batched', batcher.save)]:
+                flushed_before = batcher.batches_flushed
+                inserts = self.run(save, sender, group, options['senders'], options['seconds'])
+                commits = inserts if label == 'direct' else batcher.batches_flushed - flushed_before
+                self.stdout.write(
+                    f'{label:<12} {inserts / options["seconds"]:>10.0f} {commits:>8} {inserts / max(commits, 1):>10.1f}'
+                )
+
+    def run(self, save, sender, group, senders, seconds):
+        """Have every sender post group messages back to back; returns messages saved"""
+        stop = threading.Event()
+        counts = [0] * senders
+
+        def post(index):
+            try:
+                while not stop.is_set():
+                    save(Message(sender=sender, content='Announcement', is_group_message=True, group=group))
+                    counts[index] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post, args=(i,)) for i in range(senders)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return sum(counts)
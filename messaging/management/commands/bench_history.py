@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from accounts.models import User
+from core.benchmarks import benchmark_database, time_call
+from messaging.models import Conversation, Message
+from messaging.pagination import keyset_page
+from messaging.views import HISTORY_PAGE_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Benchmark keyset-paginated conversation history against loading the full history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--skip-full', action='store_true', help='Skip timing the full-history load')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            alice = User.objects.create_user('bench_alice', 'alice@bench.local', 'pass')
+            bob = User.objects.create_user('bench_bob', 'bob@bench.local', 'pass')
+            conversation = Conversation.objects.create(user1=alice, user2=bob)
+            history = conversation.messages.prefetch_related('sender')
+
+            self.stdout.write(f"{'messages':>10} {'latest page':>13} {'deep page':>11} {'full load':>11}")
+            for size in sorted(options['sizes']):
+                self.fill(conversation, alice, bob, size)
+
+                middle = conversation.messages.order_by('id')[size // 2]
+                cursor = (middle.created_at, middle.id)
+
+                latest = time_call(lambda: keyset_page(history, None, HISTORY_PAGE_SIZE))
+                deep = time_call(lambda: keyset_page(history, cursor, HISTORY_PAGE_SIZE))
+                full = '-' if options['skip_full'] else f"{time_call(lambda: list(history.all()), repeat=1):.1f}ms"
+
+                self.stdout.write(f"{size:>10} {latest:>11.2f}ms {deep:>9.2f}ms {full:>11}")
+
+    def fill(self, conversation, alice, bob, size):
+        """Top the conversation up to ``size`` messages"""
+        missing = size - conversation.messages.count()
+        batch = [
+            Message(
+                conversation=conversation,
+                sender=alice if i % 2 else bob,
+                receiver=bob if i % 2 else alice,
+                content=f'Benchmark message {i}',
+            )
+            for i in range(missing)
+        ]
+        Message.objects.bulk_create(batch, batch_size=5000)
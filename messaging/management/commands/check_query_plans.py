@@ -0,0 +1,124 @@
+import re
+from contextlib import ExitStack
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import User
+from moderation.models import Block
+from messaging.models import Conversation, Message, ArchivedMessage, FirstContactTracker, ChatGroup, ChatMembership
+from messaging.pagination import keyset_page
+from messaging.search import search_messages
+from messaging.sync import collect_deltas
+from messaging.views import INBOX_PAGE_SIZE, HISTORY_PAGE_SIZE
+
+# A plan step that walks a whole table (or a whole index) instead of searching it.
+# FTS5 lookups show up as SCAN of a virtual table with an index constraint, and
+# multi-row INSERT ... VALUES as a scan of its constant rows.
+FULL_SCAN = re.compile(r'^SCAN (?!(\d+ )?CONSTANT ROWS?)(?!\S+ VIRTUAL TABLE INDEX \d+:M)')
+
+# Hot paths that page through a user's rows have to read them in index order; a
+# temporary B-tree means every matching row is sorted before the page is cut
+SORTED_BY_INDEX = {'inbox page'}
+TEMP_SORT = re.compile(r'TEMP B-TREE')
+
+
+def hot_queries():
+    """The messaging hot paths, as callables that run the same queries as the views"""
+    user = User(pk=1)
+    other = User(pk=2)
+    conversation = Conversation(pk=1, user1_id=1, user2_id=2)
+    cursor = (timezone.now(), 1000)
+
+    return [
+        ('inbox page', lambda: Conversation.objects.inbox_page(user, cursor, INBOX_PAGE_SIZE)),
+        ('total unread', lambda: Message.objects.unread_for(user).count()),
+        ('conversation lookup', lambda: Conversation.objects.between(user, other, create=False)),
+        ('mark read', lambda: conversation.mark_read(user)),
+        ('new conversation messages', lambda: list(
+            conversation.messages.filter(id__gt=100).prefetch_related('sender')
+        )),
+        ('conversation history', lambda: keyset_page(
+            conversation.messages.prefetch_related('sender'), cursor, HISTORY_PAGE_SIZE
+        )),
+        ('new group messages', lambda: list(Message.objects.filter(
+            is_group_message=True, group_id=1, id__gt=100
+        ).prefetch_related('sender'))),
+        ('archived conversation history', lambda: keyset_page(
+            conversation.archived_messages.prefetch_related('sender'), cursor, HISTORY_PAGE_SIZE
+        )),
+        ('archived group history', lambda: keyset_page(
+            ArchivedMessage.objects.filter(is_group_message=True, group_id=1).prefetch_related('sender'),
+            cursor, HISTORY_PAGE_SIZE,
+        )),
+        ('group history', lambda: keyset_page(
+            Message.objects.filter(is_group_message=True, group_id=1).prefetch_related('sender'),
+            cursor, HISTORY_PAGE_SIZE,
+        )),
+        ('block set load', lambda: list(Block.objects.filter(
+            Q(blocker=user) | Q(blocked=user)
+        ).order_by().values_list('blocker_id', 'blocked_id'))),
+        ('message search', lambda: search_messages(user, 'hello', [1, 2])),
+        ('readable groups', lambda: list(ChatGroup.objects.readable_by(user).values_list('id', 'slug'))),
+        ('group unread counts', lambda: ChatMembership.objects.unread_counts(user, [1, 2])),
+        ('mark group read', lambda: ChatMembership.objects.mark_read(user, 1, 100)),
+        ('delta sync', lambda: collect_deltas(user, {'2': 100, '3': 100}, {'all': 100})),
+        ('first contact tracker', lambda: FirstContactTracker.objects.filter(
+            sender=user, receiver=other
+        ).first()),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN QUERY PLAN on every messaging hot query and fail on full table scans or unindexed sorts'
+
+    def handle(self, *args, **options):
+        if any(connections[alias].vendor != 'sqlite' for alias in connections):
+            raise CommandError('check_query_plans only understands SQLite query plans.')
+
+        failures = []
+        # Writes on the hot paths (mark read) are rolled back, on every database
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(transaction.atomic(using=alias))
+
+            for name, run in hot_queries():
+                # Hot paths touch both databases: messaging rows, users and blocks in default
+                with ExitStack() as capture:
+                    contexts = {
+                        alias: capture.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in connections
+                    }
+                    run()
+                captured = [
+                    (alias, query['sql'])
+                    for alias, ctx in contexts.items()
+                    for query in ctx.captured_queries
+                ]
+
+                for alias, sql in captured:
+                    plan = self.explain(alias, sql)
+                    scans = [step for step in plan if FULL_SCAN.match(step)]
+                    if name in SORTED_BY_INDEX:
+                        scans += [step for step in plan if TEMP_SORT.search(step)]
+                    if scans:
+                        failures.append(name)
+                        self.stdout.write(self.style.ERROR(f'FAIL  {name}: {"; ".join(scans)}'))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f'OK    {name}'))
+
+                    if options['verbosity'] > 1:
+                        for step in plan:
+                            self.stdout.write(f'        {step}')
+
+            for alias in connections:
+                transaction.set_rollback(True, using=alias)
+
+        if failures:
+            raise CommandError(f'Full table scan or unindexed sort in: {", ".join(sorted(set(failures)))}')
+
+    def explain(self, alias, sql):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[3] for row in cursor.fetchall()]
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from messaging.models import Conversation
+
+
+class Command(BaseCommand):
+    help = "Recompute every conversation's last message pointer from its messages, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds between batches, so chat writes get the lock in between')
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        repaired = 0
+        while True:
+            # Keyset over the primary key, so each batch is one short range update
+            pks = list(Conversation.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True
+            )[:options['batch_size']])
+            if not pks:
+                break
+            repaired += Conversation.objects.filter(pk__gte=pks[0], pk__lte=pks[-1]).refresh_last_message()
+            last_pk = pks[-1]
+            time.sleep(options['pause'])
+        self.stdout.write(f'Recomputed the last message of {repaired} conversations')
@@ -0,0 +1,119 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from club_website.routers import MESSAGING_DB
+from messaging.models import Conversation, Message, FirstContactTracker
+
+SOURCE_DB = 'default'
+COPY_BATCH_SIZE = 2000
+RETIRED_SUFFIX = '_moved'
+
+# Conversations before the messages that point at them
+MOVED_MODELS = [Conversation, FirstContactTracker, Message]
+
+
+class Command(BaseCommand):
+    help = 'Move messaging rows left in the default database into the messaging database (a no-op once moved)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=COPY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        tables = [model._meta.db_table for model in MOVED_MODELS]
+        if not set(tables) <= set(connections[SOURCE_DB].introspection.table_names()):
+            self.stdout.write('No messaging tables in the default database, nothing to move.')
+            return
+
+        target_tables = set(connections[MESSAGING_DB].introspection.table_names())
+        for table in tables:
+            if table in target_tables and self.has_rows(MESSAGING_DB, table):
+                raise CommandError(
+                    f'{table} already has rows in the messaging database; refusing to merge. '
+                    'Remove the messaging database to start the move over.'
+                )
+
+        # The router never migrates messaging tables in default, whatever django_migrations
+        # there says, so read the old schema off the tables themselves. The messaging
+        # database is rewound to that schema, filled, and migrated forward so the data
+        # migrations (read cursors, canonical pairs, search index) run on the copied rows.
+        columns = self.source_columns(tables)
+        migration = self.matching_migration(columns)
+        if migration is None:
+            raise CommandError('The messaging tables in the default database match no known migration.')
+
+        self.stdout.write(f'Old tables match messaging.{migration}')
+        call_command('migrate', 'messaging', migration, database=MESSAGING_DB, verbosity=0)
+        for table in tables:
+            copied = self.copy(table, columns[table], options['batch_size'])
+            self.stdout.write(f'{table}: {copied} rows')
+        call_command('migrate', 'messaging', database=MESSAGING_DB, verbosity=0)
+
+        # Renamed rather than dropped, so the copy can be checked; either way later runs
+        # find nothing to move, and the command can run on every release
+        self.retire(tables)
+        self.stdout.write(self.style.SUCCESS(
+            f'Messaging data moved. The old tables in the default database were renamed with a '
+            f'{RETIRED_SUFFIX} suffix and can be dropped once the copy is verified.'
+        ))
+
+    def retire(self, tables):
+        """Rename the copied tables out of the way in the default database"""
+        source = connections[SOURCE_DB]
+        quote = source.ops.quote_name
+        with transaction.atomic(using=SOURCE_DB), source.cursor() as cursor:
+            for table in tables:
+                cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(table + RETIRED_SUFFIX)}')
+
+    def has_rows(self, alias, table):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {table} LIMIT 1')
+            return cursor.fetchone() is not None
+
+    def source_columns(self, tables):
+        """Column names of each messaging table in the default database"""
+        source = connections[SOURCE_DB]
+        with source.cursor() as cursor:
+            return {
+                table: [column.name for column in source.introspection.get_table_description(cursor, table)]
+                for table in tables
+            }
+
+    def matching_migration(self, columns):
+        """Newest messaging migration whose schema has exactly these columns"""
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaf = loader.graph.leaf_nodes('messaging')[0]
+        plan = [key for key in loader.graph.forwards_plan(leaf) if key[0] == 'messaging']
+
+        for key in reversed(plan):
+            state = loader.project_state(key)
+            state_columns = {
+                model._meta.db_table: {field.column for field in model._meta.concrete_fields}
+                for model in state.apps.get_app_config('messaging').get_models()
+            }
+            if all(state_columns.get(table) == set(names) for table, names in columns.items()):
+                return key[1]
+        return None
+
+    def copy(self, table, columns, batch_size):
+        """Copy a table row for row, ids and timestamps included, in bounded batches"""
+        quote = connections[MESSAGING_DB].ops.quote_name
+        column_list = ', '.join(quote(column) for column in columns)
+        placeholders = ', '.join(['%s'] * len(columns))
+        pk_index = columns.index('id')
+        select = f'SELECT {column_list} FROM {table} WHERE id > %s ORDER BY id LIMIT %s'
+        insert = f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})'
+
+        copied = 0
+        last_pk = 0
+        while True:
+            with connections[SOURCE_DB].cursor() as cursor:
+                cursor.execute(select, [last_pk, batch_size])
+                rows = cursor.fetchall()
+            if not rows:
+                return copied
+
+            with transaction.atomic(using=MESSAGING_DB), connections[MESSAGING_DB].cursor() as cursor:
+                cursor.executemany(insert, rows)
+            copied += len(rows)
+            last_pk = rows[-1][pk_index]
@@ -0,0 +1,55 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.utils.text import slugify
+from accounts.models import Profile
+from competitions.models import Competition, Submission
+from messaging.models import ChatGroup
+
+SLUG_LENGTH = ChatGroup._meta.get_field('slug').max_length
+
+
+class Command(BaseCommand):
+    help = 'Create a team channel for every competition and school and bring its members up to date'
+
+    def handle(self, *args, **options):
+        # Participants are everyone with a submission, plus the organiser
+        participants = defaultdict(set)
+        for competition_id, user_id in Submission.objects.values_list('competition_id', 'user_id').iterator():
+            participants[competition_id].add(user_id)
+
+        for competition in Competition.objects.only('pk', 'title', 'created_by_id'):
+            group = self.channel(
+                f'competition-{competition.pk}',
+                f'{competition.title} team',
+                competition_id=competition.pk,
+            )
+            self.sync(group, participants[competition.pk] | {competition.created_by_id})
+
+        # School is free text: spellings that slugify alike share a channel
+        schools = defaultdict(set)
+        names = {}
+        for user_id, school in Profile.objects.exclude(school='').values_list('user_id', 'school').iterator():
+            key = slugify(school)
+            if key:
+                schools[key].add(user_id)
+                names.setdefault(key, school.strip())
+
+        for key, user_ids in schools.items():
+            group = self.channel(f'school-{key}'[:SLUG_LENGTH], names[key], school=names[key])
+            self.sync(group, user_ids)
+
+    def channel(self, slug, name, **fields):
+        """The members-only group with this slug, created or renamed as needed"""
+        group, created = ChatGroup.objects.get_or_create(
+            slug=slug,
+            defaults=dict(name=name, audience=ChatGroup.AUDIENCE_MEMBERS, **fields),
+        )
+        if not created and group.name != name:
+            group.name = name
+            group.save(update_fields=['name'])
+        return group
+
+    def sync(self, group, user_ids):
+        added, removed = group.set_members(user_ids)
+        if added or removed:
+            self.stdout.write(f'{group.slug}: +{len(added)} -{len(removed)}')
@@ -5,6 +5,8 @@ from django.conf import settings
 from django.db import migrations, models
 
 
+# User foreign keys carry no database constraint: messaging lives in its own
+# database, which has no accounts_user table to reference
 class Migration(migrations.Migration):
 
     initial = True
@@ -20,8 +22,8 @@ class Migration(migrations.Migration):
                 ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('created_at', models.DateTimeField(auto_now_add=True)),
                 ('updated_at', models.DateTimeField(auto_now=True)),
-                ('user1', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_user1', to=settings.AUTH_USER_MODEL)),
-                ('user2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_user2', to=settings.AUTH_USER_MODEL)),
+                ('user1', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_user1', to=settings.AUTH_USER_MODEL)),
+                ('user2', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_user2', to=settings.AUTH_USER_MODEL)),
             ],
             options={
                 'unique_together': {('user1', 'user2')},
@@ -37,8 +39,8 @@ class Migration(migrations.Migration):
                 ('is_group_message', models.BooleanField(default=False)),
                 ('group_type', models.CharField(blank=True, choices=[('all', 'All Members'), ('admin', 'Admins Only')], max_length=20, null=True)),
                 ('conversation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='messaging.conversation')),
-                ('receiver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_messages', to=settings.AUTH_USER_MODEL)),
-                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_messages', to=settings.AUTH_USER_MODEL)),
+                ('receiver', models.ForeignKey(db_constraint=False, blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_messages', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sent_messages', to=settings.AUTH_USER_MODEL)),
             ],
             options={
                 'ordering': ['created_at'],
@@ -51,8 +53,8 @@ class Migration(migrations.Migration):
                 ('message_count', models.PositiveIntegerField(default=0)),
                 ('receiver_replied', models.BooleanField(default=False)),
                 ('created_at', models.DateTimeField(auto_now_add=True)),
-                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='first_contacts_received', to=settings.AUTH_USER_MODEL)),
-                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='first_contacts_sent', to=settings.AUTH_USER_MODEL)),
+                ('receiver', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='first_contacts_received', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='first_contacts_sent', to=settings.AUTH_USER_MODEL)),
             ],
             options={
                 'unique_together': {('sender', 'receiver')},
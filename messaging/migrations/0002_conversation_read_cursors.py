@@ -0,0 +1,56 @@
+from django.db import migrations, models
+from django.db.models import Max, Min, Q
+
+
+def backfill_read_cursors(apps, schema_editor):
+    """Derive each participant's read cursor from the per-message is_read flags"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    
+    conversations = Conversation.objects.annotate(
+        last_id=Max('messages__id'),
+        user1_first_unread=Min(
+            'messages__id',
+            filter=Q(messages__receiver=models.F('user1'), messages__is_read=False),
+        ),
+        user2_first_unread=Min(
+            'messages__id',
+            filter=Q(messages__receiver=models.F('user2'), messages__is_read=False),
+        ),
+    ).filter(last_id__isnull=False)
+    
+    batch = []
+    for conv in conversations.iterator(chunk_size=500):
+        # Everything before the first unread message counts as read
+        conv.user1_last_read_id = (conv.user1_first_unread or conv.last_id + 1) - 1
+        conv.user2_last_read_id = (conv.user2_first_unread or conv.last_id + 1) - 1
+        batch.append(conv)
+        if len(batch) >= 500:
+            Conversation.objects.bulk_update(batch, ['user1_last_read_id', 'user2_last_read_id'])
+            batch = []
+    if batch:
+        Conversation.objects.bulk_update(batch, ['user1_last_read_id', 'user2_last_read_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user1_last_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user2_last_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_read_cursors, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
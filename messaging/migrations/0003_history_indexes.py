@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 20:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_conversation_read_cursors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='msg_conv_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_group_message', True)), fields=['group_type', 'created_at', 'id'], name='msg_group_history_idx'),
+        ),
+    ]
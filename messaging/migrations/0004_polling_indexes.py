@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 20:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('receiver__isnull', False)), fields=['receiver', 'conversation', 'id'], name='msg_receiver_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_group_message', True)), fields=['group_type', 'id'], name='msg_group_poll_idx'),
+        ),
+    ]
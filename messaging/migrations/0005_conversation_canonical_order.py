@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def canonicalize_pairs(apps, schema_editor):
+    """Store every conversation with the lower user id as user1
+    
+    Conversations a user opened with themselves cannot be ordered and are
+    dropped, with their messages.
+    """
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    
+    self_pairs = Conversation.objects.filter(user1=F('user2'))
+    Message.objects.filter(conversation__in=self_pairs).delete()
+    self_pairs.delete()
+    
+    for conv in Conversation.objects.filter(user1__gt=F('user2')):
+        twin = Conversation.objects.filter(user1=conv.user2_id, user2=conv.user1_id).first()
+        if twin:
+            # Both orderings exist: fold this thread into the canonical one, keeping
+            # whichever read cursor is further along for each user
+            Message.objects.filter(conversation=conv).update(conversation=twin)
+            twin.user1_last_read_id = max(twin.user1_last_read_id, conv.user2_last_read_id)
+            twin.user2_last_read_id = max(twin.user2_last_read_id, conv.user1_last_read_id)
+            twin.save(update_fields=['user1_last_read_id', 'user2_last_read_id'])
+            conv.delete()
+        else:
+            conv.user1_id, conv.user2_id = conv.user2_id, conv.user1_id
+            conv.user1_last_read_id, conv.user2_last_read_id = conv.user2_last_read_id, conv.user1_last_read_id
+            conv.save(update_fields=['user1', 'user2', 'user1_last_read_id', 'user2_last_read_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_polling_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.CheckConstraint(condition=models.Q(('user1__lt', models.F('user2'))), name='conversation_canonical_pair_order'),
+        ),
+    ]
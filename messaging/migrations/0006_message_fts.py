@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# External-content FTS5 index over Message.content, kept in sync by triggers
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE messaging_message_fts USING fts5(
+        content,
+        content='messaging_message',
+        content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER messaging_message_fts_insert AFTER INSERT ON messaging_message BEGIN
+        INSERT INTO messaging_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER messaging_message_fts_delete AFTER DELETE ON messaging_message BEGIN
+        INSERT INTO messaging_message_fts(messaging_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER messaging_message_fts_update AFTER UPDATE OF content ON messaging_message BEGIN
+        INSERT INTO messaging_message_fts(messaging_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messaging_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO messaging_message_fts(messaging_message_fts) VALUES ('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS messaging_message_fts_update",
+    "DROP TRIGGER IF EXISTS messaging_message_fts_delete",
+    "DROP TRIGGER IF EXISTS messaging_message_fts_insert",
+    "DROP TABLE IF EXISTS messaging_message_fts",
+]
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite-only; other databases skip the search index
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_conversation_canonical_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(FORWARD_SQL), run_sql(REVERSE_SQL)),
+    ]
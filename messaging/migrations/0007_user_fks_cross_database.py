@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-17 20:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0006_message_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='user1',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='conversations_as_user1', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='conversation',
+            name='user2',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='conversations_as_user2', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='firstcontacttracker',
+            name='receiver',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='first_contacts_received', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='firstcontacttracker',
+            name='sender',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='first_contacts_sent', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='receiver',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='received_messages', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='sender',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='sent_messages', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 20:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_user_fks_cross_database'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_type', models.CharField(choices=[('all', 'All Members'), ('admin', 'Admins Only')], max_length=20)),
+                ('last_read_id', models.PositiveBigIntegerField(default=0)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='group_read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'group_type')},
+            },
+        ),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 6.0 on 2026-10-17 21:06
+
+from importlib import import_module
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+message_fts = import_module('messaging.migrations.0006_message_fts')
+
+# The two hard-coded group chats become groups, keeping their slugs for old links
+BUILTIN_GROUPS = [
+    ('all', 'All Members', 'everyone'),
+    ('admin', 'Admins Only', 'admins'),
+]
+
+
+def create_builtin_groups(apps, schema_editor):
+    """Create the built-in groups and move messages and read cursors onto them"""
+    ChatGroup = apps.get_model('messaging', 'ChatGroup')
+    ChatMembership = apps.get_model('messaging', 'ChatMembership')
+    GroupReadCursor = apps.get_model('messaging', 'GroupReadCursor')
+    Message = apps.get_model('messaging', 'Message')
+
+    for slug, name, audience in BUILTIN_GROUPS:
+        group = ChatGroup.objects.create(slug=slug, name=name, audience=audience)
+        Message.objects.filter(is_group_message=True, group_type=slug).update(group=group)
+
+        cursors = GroupReadCursor.objects.filter(group_type=slug).values_list('user_id', 'last_read_id')
+        ChatMembership.objects.bulk_create(
+            (ChatMembership(group=group, user_id=user_id, last_read_id=last_read_id) for user_id, last_read_id in cursors.iterator()),
+            batch_size=500,
+        )
+
+
+def restore_group_types(apps, schema_editor):
+    ChatGroup = apps.get_model('messaging', 'ChatGroup')
+    ChatMembership = apps.get_model('messaging', 'ChatMembership')
+    GroupReadCursor = apps.get_model('messaging', 'GroupReadCursor')
+    Message = apps.get_model('messaging', 'Message')
+
+    for slug, _, _ in BUILTIN_GROUPS:
+        Message.objects.filter(group__slug=slug).update(group_type=slug)
+        memberships = ChatMembership.objects.filter(group__slug=slug).values_list('user_id', 'last_read_id')
+        GroupReadCursor.objects.bulk_create(
+            (GroupReadCursor(group_type=slug, user_id=user_id, last_read_id=last_read_id) for user_id, last_read_id in memberships.iterator()),
+            batch_size=500,
+        )
+    # Other groups have no group type to go back to
+    Message.objects.filter(is_group_message=True, group_type__isnull=True).delete()
+    Message.objects.update(group=None)
+    ChatGroup.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0001_initial'),
+        ('messaging', '0008_group_read_cursor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Unapplying rebuilds the message table, which drops the search index triggers
+        migrations.RunPython(
+            migrations.RunPython.noop,
+            message_fts.run_sql(message_fts.REVERSE_SQL + message_fts.FORWARD_SQL),
+        ),
+        migrations.CreateModel(
+            name='ChatGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('audience', models.CharField(choices=[('everyone', 'All members'), ('admins', 'Admins only'), ('members', 'Listed members')], default='members', max_length=20)),
+                ('school', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('competition', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='chat_groups', to='competitions.competition')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['audience'], name='chatgroup_audience_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_id', models.PositiveBigIntegerField(default=0)),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='messaging.chatgroup')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='chat_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'group')},
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='messaging.chatgroup'),
+        ),
+        migrations.RunPython(create_builtin_groups, restore_group_types),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='msg_group_history_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='msg_group_poll_idx',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='group_type',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_group_message', True)), fields=['group', 'created_at', 'id'], name='msg_group_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_group_message', True)), fields=['group', 'id'], name='msg_group_poll_idx'),
+        ),
+        migrations.DeleteModel(
+            name='GroupReadCursor',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 21:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_chat_groups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('compressed_content', models.BinaryField()),
+                ('created_at', models.DateTimeField()),
+                ('is_group_message', models.BooleanField(default=False)),
+                ('conversation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='messaging.conversation')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='messaging.chatgroup')),
+                ('receiver', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_received_messages', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_sent_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['conversation', 'created_at', 'id'], name='archived_conv_history_idx'), models.Index(condition=models.Q(('is_group_message', True)), fields=['group', 'created_at', 'id'], name='archived_group_history_idx')],
+            },
+        ),
+    ]
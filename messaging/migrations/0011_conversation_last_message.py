@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-17 21:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_last_message(apps, schema_editor):
+    """Point every conversation at its newest live or archived message, a batch at a time"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    ArchivedMessage = apps.get_model('messaging', 'ArchivedMessage')
+    db = schema_editor.connection.alias
+
+    def latest(model, field):
+        return Subquery(
+            model.objects.using(db).filter(conversation=OuterRef('pk')).order_by('-created_at', '-id').values(field)[:1]
+        )
+
+    ids = list(Conversation.objects.using(db).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), BACKFILL_BATCH_SIZE):
+        Conversation.objects.using(db).filter(pk__in=ids[start:start + BACKFILL_BATCH_SIZE]).update(
+            last_message_id=Coalesce(latest(Message, 'id'), latest(ArchivedMessage, 'id'), Value(0)),
+            last_message_at=Coalesce(
+                latest(Message, 'created_at'), latest(ArchivedMessage, 'created_at'), F('created_at')
+            ),
+            last_sender_id=Coalesce(latest(Message, 'sender_id'), latest(ArchivedMessage, 'sender_id')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_message_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_sender',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user1', 'last_message_at', 'id'], name='conv_user1_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user2', 'last_message_at', 'id'], name='conv_user2_activity_idx'),
+        ),
+    ]
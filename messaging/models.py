@@ -1,24 +1,247 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q, F, Case, When, Value, Count, OuterRef, Prefetch, Subquery, IntegerField
+from django.db.models.functions import Coalesce, Substr
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
+from accounts.models import User
+from competitions.models import Competition
+from moderation.blocks import get_block_set
+from .archive import decompress
+from .groups import bump_group_generation, invalidate_group_access
+from .mailbox import bump_mailbox
+from .pagination import encode_cursor, keyset_page
+
+
+class ConversationQuerySet(models.QuerySet):
+    """Query helpers for conversations"""
+
+    def for_user(self, user):
+        """Conversations the user takes part in"""
+        return self.filter(Q(user1=user) | Q(user2=user))
+
+    def between(self, user_a, user_b, create=True):
+        """The conversation between two users (or user ids)
+        
+        The pair is stored in canonical order (lower id as user1), so this is a single
+        equality lookup on the unique index. Creation goes through get_or_create, which
+        runs in a savepoint and re-fetches if a concurrent request created it first.
+        Returns None when ``create`` is False and no conversation exists yet.
+        """
+        user1_id, user2_id = sorted((getattr(user_a, 'pk', user_a), getattr(user_b, 'pk', user_b)))
+        if not create:
+            return self.filter(user1_id=user1_id, user2_id=user2_id).first()
+        return self.get_or_create(user1_id=user1_id, user2_id=user2_id)[0]
+
+    def create_between(self, user_a, user_b):
+        """Create a conversation already known to be missing, with a single insert
+        
+        Falls back to the existing one if a concurrent request created it first.
+        """
+        user1_id, user2_id = sorted((getattr(user_a, 'pk', user_a), getattr(user_b, 'pk', user_b)))
+        try:
+            with transaction.atomic(using=self.db):
+                return self.create(user1_id=user1_id, user2_id=user2_id)
+        except IntegrityError:
+            return self.get(user1_id=user1_id, user2_id=user2_id)
+
+    def inbox_page(self, user, cursor, size):
+        """One page of the user's inbox, most recently active first, with inbox data
+        
+        The user is on either side of a pair, so each side is paged from its own
+        activity index and the two pages are merged; an OR of both would need a
+        sort over every conversation the user has. Only the conversations on the
+        page are then annotated, so the cost does not grow with the inbox.
+        Returns the conversations and the cursor for the next page.
+        """
+        page, has_more = [], False
+        for side in (self.filter(user1=user), self.filter(user2=user)):
+            items, next_cursor = keyset_page(
+                side.only('id', 'last_message_at'), cursor, size, time_field='last_message_at', oldest_first=False,
+            )
+            page += items
+            has_more = has_more or next_cursor is not None
+        page.sort(key=lambda conv: (conv.last_message_at, conv.pk), reverse=True)
+        has_more = has_more or len(page) > size
+        page = page[:size]
+        next_cursor = encode_cursor(page[-1].last_message_at, page[-1].pk) if has_more else None
+        
+        # Sorted here rather than in SQL, by the order the page was picked in
+        annotated = Conversation.objects.filter(pk__in=[conv.pk for conv in page]).with_inbox_data(user).in_bulk()
+        conversations = [annotated[conv.pk] for conv in page]
+        for conv in conversations:
+            if conv.archived_last_message is not None:
+                conv.last_message_preview = decompress(bytes(conv.archived_last_message))[:100]
+        return conversations, next_cursor
+
+    def with_inbox_data(self, user):
+        """Annotate unread count and last message preview for the inbox in one query
+        
+        The preview is a primary key lookup of the stored last message. If that
+        message was archived, ``archived_last_message`` holds its compressed
+        content instead, which inbox_page() decompresses into the preview.
+        """
+        unread = Message.objects.filter(
+            conversation=OuterRef('pk'), id__gt=OuterRef('my_last_read_id')
+        ).exclude(
+            sender=user
+        ).order_by().values('conversation').annotate(total=Count('id')).values('total')
+        
+        return self.annotate(
+            my_last_read_id=Case(
+                When(user1=user, then=F('user1_last_read_id')),
+                default=F('user2_last_read_id'),
+            ),
+            unread=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+            last_message_preview=Subquery(
+                Message.objects.filter(pk=OuterRef('last_message_id')).annotate(
+                    preview=Substr('content', 1, 100)
+                ).values('preview')[:1]
+            ),
+        ).annotate(
+            # Only looked up when the last message is no longer live
+            archived_last_message=Case(
+                When(last_message_preview__isnull=True, last_message_id__gt=0, then=Subquery(
+                    ArchivedMessage.objects.filter(pk=OuterRef('last_message_id')).values('compressed_content')[:1]
+                )),
+                output_field=models.BinaryField(),
+            ),
+        ).prefetch_related(
+            # Users live in the default database, so they are prefetched rather than joined
+            Prefetch('user1', queryset=User.objects.select_related('profile')),
+            Prefetch('user2', queryset=User.objects.select_related('profile')),
+        )
+
+    def record_message(self, message):
+        """Point the conversation at a message just sent, with a single-row update
+        
+        The pointer only moves forward, so concurrent sends settle on the newest.
+        """
+        return self.filter(pk=message.conversation_id, last_message_id__lt=message.pk).update(
+            last_message_id=message.pk,
+            last_message_at=message.created_at,
+            last_sender_id=message.sender_id,
+            updated_at=timezone.now(),
+        )
+
+    def refresh_last_message(self):
+        """Recompute the last message pointers from the messages themselves
+        
+        Falls back to the archive for conversations whose messages were all archived,
+        and to the creation time for conversations without any. Returns rows updated.
+        """
+        def latest(model, field):
+            return Subquery(
+                model.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id').values(field)[:1]
+            )
+        
+        return self.update(
+            last_message_id=Coalesce(latest(Message, 'id'), latest(ArchivedMessage, 'id'), Value(0)),
+            last_message_at=Coalesce(
+                latest(Message, 'created_at'), latest(ArchivedMessage, 'created_at'), F('created_at')
+            ),
+            last_sender_id=Coalesce(latest(Message, 'sender_id'), latest(ArchivedMessage, 'sender_id')),
+        )
+
+    def mark_read_many(self, user, read_ids):
+        """Advance the user's read cursors in several conversations at once
+        
+        ``read_ids`` maps conversations to the newest message the user has seen.
+        One update for the conversations where the user is user1 and one for those
+        where they are user2; cursors never move backwards.
+        """
+        updated = 0
+        for side in ('user1', 'user2'):
+            targets = {conv.pk: message_id for conv, message_id in read_ids.items() if getattr(conv, f'{side}_id') == user.pk}
+            if not targets:
+                continue
+            field = f'{side}_last_read_id'
+            read_to = Case(
+                *[When(pk=pk, then=Value(message_id)) for pk, message_id in targets.items()],
+                output_field=models.PositiveBigIntegerField(),
+            )
+            updated += self.filter(pk__in=targets, **{f'{field}__lt': read_to}).update(**{field: read_to})
+        if updated:
+            # The user's unread count changed
+            bump_mailbox(user.pk)
+        return updated
+
+
+class MessageQuerySet(models.QuerySet):
+    """Query helpers for messages"""
+
+    def unread_for(self, user):
+        """Private messages to the user past their conversation read cursor
+        
+        Messages from users with a block either way are left out, as their
+        conversations are from the inbox.
+        """
+        unread = self.filter(receiver=user).filter(
+            Q(conversation__user1=user, id__gt=F('conversation__user1_last_read_id')) |
+            Q(conversation__user2=user, id__gt=F('conversation__user2_last_read_id'))
+        )
+        blocked_ids = get_block_set(user).user_ids
+        if blocked_ids:
+            unread = unread.exclude(sender_id__in=blocked_ids)
+        return unread
+
+    def latest_group_message_id(self, group_id):
+        """Id of the newest message in a group chat, or 0"""
+        latest = self.filter(is_group_message=True, group_id=group_id).order_by('-id').values_list('id', flat=True)
+        return latest.first() or 0
+
 
 class Conversation(models.Model):
     """Private conversation between two users"""
     
     user1 = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='conversations_as_user1'
     )
     user2 = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='conversations_as_user2'
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Read high-water marks: every message with a higher id is unread for that participant
+    user1_last_read_id = models.PositiveBigIntegerField(default=0)
+    user2_last_read_id = models.PositiveBigIntegerField(default=0)
+    
+    # Newest message, kept up to date on send so the inbox never aggregates messages.
+    # Without messages last_message_id is 0 and last_message_at the creation time.
+    last_message_id = models.PositiveBigIntegerField(default=0)
+    last_message_at = models.DateTimeField(default=timezone.now)
+    last_sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    
+    objects = ConversationQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['user1', 'user2']
+        indexes = [
+            # The inbox: a user's conversations by last activity, from either side of the pair
+            models.Index(fields=['user1', 'last_message_at', 'id'], name='conv_user1_activity_idx'),
+            models.Index(fields=['user2', 'last_message_at', 'id'], name='conv_user2_activity_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(user1__lt=F('user2')),
+                name='conversation_canonical_pair_order',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user1.username} ↔ {self.user2.username}"
@@ -27,9 +250,110 @@ class Conversation(models.Model):
         """Get the other user in conversation"""
         return self.user2 if self.user1 == current_user else self.user1
     
+    def last_read_field(self, user):
+        """Name of the read cursor field belonging to a user"""
+        return 'user1_last_read_id' if self.user1_id == user.id else 'user2_last_read_id'
+    
     def unread_count(self, user):
         """Count unread messages for a user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).count()
+        last_read_id = getattr(self, self.last_read_field(user))
+        return self.messages.filter(id__gt=last_read_id).exclude(sender=user).count()
+    
+    def mark_read(self, user, message_id=None):
+        """Advance the user's read cursor with a single-row update
+        
+        Defaults to the newest message in the conversation. The cursor never moves backwards.
+        """
+        field = self.last_read_field(user)
+        if message_id is None:
+            message_id = Subquery(
+                Message.objects.filter(conversation=self).order_by('-id').values('id')[:1]
+            )
+        updated = Conversation.objects.filter(
+            pk=self.pk, **{f'{field}__lt': message_id}
+        ).update(**{field: message_id})
+        if updated:
+            # The user's unread count changed
+            bump_mailbox(user.pk)
+        return updated
+
+
+class ChatGroupQuerySet(models.QuerySet):
+    """Query helpers for group chats"""
+
+    def readable_by(self, user):
+        """Groups the user can read: open to everyone, admins only, or by membership"""
+        audiences = [ChatGroup.AUDIENCE_EVERYONE]
+        if user.is_admin:
+            audiences.append(ChatGroup.AUDIENCE_ADMINS)
+        member_of = ChatMembership.objects.filter(user=user).values('group')
+        return self.filter(Q(audience__in=audiences) | Q(pk__in=member_of, audience=ChatGroup.AUDIENCE_MEMBERS))
+
+
+class ChatGroup(models.Model):
+    """Group chat
+    
+    The audience decides who can read it. Team channels for a competition or a
+    school list their members in ChatMembership; the all members and admin chats
+    need no rows at all. A message is stored once however many members there are.
+    """
+    
+    AUDIENCE_EVERYONE = 'everyone'
+    AUDIENCE_ADMINS = 'admins'
+    AUDIENCE_MEMBERS = 'members'
+    AUDIENCE_CHOICES = [
+        (AUDIENCE_EVERYONE, 'All members'),
+        (AUDIENCE_ADMINS, 'Admins only'),
+        (AUDIENCE_MEMBERS, 'Listed members'),
+    ]
+    
+    slug = models.SlugField(max_length=100, unique=True)
+    name = models.CharField(max_length=200)
+    audience = models.CharField(max_length=20, choices=AUDIENCE_CHOICES, default=AUDIENCE_MEMBERS)
+    # What a team channel belongs to, if anything
+    competition = models.ForeignKey(
+        Competition,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='chat_groups',
+        null=True,
+        blank=True
+    )
+    school = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ChatGroupQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The open groups are looked up by audience, team channels through memberships
+            models.Index(fields=['audience'], name='chatgroup_audience_idx'),
+        ]
+    
+    def __str__(self):
+        return self.name
+    
+    def set_members(self, user_ids):
+        """Make exactly these users the group's members; returns (added, removed) user ids
+        
+        New members start caught up at the newest message.
+        """
+        user_ids = set(user_ids)
+        current = set(self.memberships.values_list('user_id', flat=True))
+        added, removed = user_ids - current, current - user_ids
+        
+        with transaction.atomic(using=ChatMembership.objects.db):
+            if added:
+                last_read_id = Message.objects.latest_group_message_id(self.pk)
+                ChatMembership.objects.bulk_create([
+                    ChatMembership(group=self, user_id=user_id, last_read_id=last_read_id)
+                    for user_id in added
+                ], ignore_conflicts=True)
+            if removed:
+                self.memberships.filter(user_id__in=removed).delete()
+        invalidate_group_access(*added, *removed)
+        return added, removed
 
 
 class Message(models.Model):
@@ -44,49 +368,135 @@ class Message(models.Model):
     )
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='sent_messages'
     )
     receiver = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='received_messages',
         null=True,
         blank=True
     )
     content = models.TextField()
-    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     # Group message fields
     is_group_message = models.BooleanField(default=False)
-    group_type = models.CharField(
-        max_length=20,
-        choices=[('all', 'All Members'), ('admin', 'Admins Only')],
+    group = models.ForeignKey(
+        ChatGroup,
+        on_delete=models.CASCADE,
+        related_name='messages',
         null=True,
         blank=True
     )
     
+    objects = MessageQuerySet.as_manager()
+    
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset pagination of conversation and group history over (created_at, id)
+            models.Index(fields=['conversation', 'created_at', 'id'], name='msg_conv_history_idx'),
+            models.Index(
+                fields=['group', 'created_at', 'id'],
+                name='msg_group_history_idx',
+                condition=Q(is_group_message=True),
+            ),
+            # Polling: unread private messages and new group messages past an id
+            models.Index(
+                fields=['receiver', 'conversation', 'id'],
+                name='msg_receiver_unread_idx',
+                condition=Q(receiver__isnull=False),
+            ),
+            models.Index(
+                fields=['group', 'id'],
+                name='msg_group_poll_idx',
+                condition=Q(is_group_message=True),
+            ),
+        ]
     
     def __str__(self):
         if self.is_group_message:
-            return f"{self.sender.username} → {self.group_type} group"
+            return f"{self.sender.username} → {self.group}"
         return f"{self.sender.username} → {self.receiver.username}"
 
 
+class ArchivedMessage(models.Model):
+    """A message moved out of the live table by archive_messages
+    
+    Keeps the original id and timestamps so history cursors carry over, and
+    stores the content zlib-compressed. Archived messages are not searchable.
+    """
+    
+    id = models.BigIntegerField(primary_key=True)
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='archived_messages',
+        null=True,
+        blank=True
+    )
+    sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_sent_messages'
+    )
+    receiver = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='archived_received_messages',
+        null=True,
+        blank=True
+    )
+    compressed_content = models.BinaryField()
+    created_at = models.DateTimeField()
+    is_group_message = models.BooleanField(default=False)
+    group = models.ForeignKey(
+        ChatGroup,
+        on_delete=models.CASCADE,
+        related_name='archived_messages',
+        null=True,
+        blank=True
+    )
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # History reads continue here with the same (created_at, id) cursor
+            models.Index(fields=['conversation', 'created_at', 'id'], name='archived_conv_history_idx'),
+            models.Index(
+                fields=['group', 'created_at', 'id'],
+                name='archived_group_history_idx',
+                condition=Q(is_group_message=True),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Archived message {self.pk}"
+    
+    @property
+    def content(self):
+        return decompress(self.compressed_content)
+
+
 class FirstContactTracker(models.Model):
     """Track first contact message limits"""
     
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='first_contacts_sent'
     )
     receiver = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='first_contacts_received'
     )
     message_count = models.PositiveIntegerField(default=0)
@@ -101,4 +511,145 @@ class FirstContactTracker(models.Model):
     
     @property
     def can_send_more(self):
-        return self.receiver_replied or self.message_count < 3
\ No newline at end of file
+        return self.receiver_replied or self.message_count < 3
+
+
+class ChatMembershipQuerySet(models.QuerySet):
+    """Query helpers for group memberships and read cursors"""
+
+    def unread_counts(self, user, group_ids):
+        """Unread group messages from others in each group, as a dict of group id to count
+        
+        One statement: each of the user's membership rows counts its group's messages
+        over an indexed id range. Groups open to everyone or to admins get a row the
+        first time they are counted, caught up at the newest message rather than with
+        the whole group history unread.
+        """
+        unread = Message.objects.filter(
+            is_group_message=True,
+            group=OuterRef('group'),
+            id__gt=OuterRef('last_read_id'),
+        ).exclude(sender=user).order_by().values('group').annotate(total=Count('id')).values('total')
+        
+        counts = dict(self.filter(user=user, group__in=group_ids).annotate(
+            unread=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+        ).values_list('group', 'unread'))
+        
+        missing = [group_id for group_id in group_ids if group_id not in counts]
+        if missing:
+            self.bulk_create([
+                ChatMembership(
+                    user=user,
+                    group_id=group_id,
+                    last_read_id=Message.objects.latest_group_message_id(group_id),
+                )
+                for group_id in missing
+            ], ignore_conflicts=True)
+            counts.update(dict.fromkeys(missing, 0))
+        return {group_id: counts[group_id] for group_id in group_ids}
+
+    def mark_read(self, user, group_id, message_id=None):
+        """Advance the user's cursor in a group; it never moves backwards
+        
+        Defaults to the newest message in the group. Callers check access first:
+        this creates the row for a group open to the user that has none yet.
+        """
+        if message_id is None:
+            message_id = Message.objects.latest_group_message_id(group_id)
+        updated = self.filter(
+            user=user, group_id=group_id, last_read_id__lt=message_id
+        ).update(last_read_id=message_id)
+        if not updated:
+            _, updated = self.get_or_create(user=user, group_id=group_id, defaults={'last_read_id': message_id})
+        if updated:
+            # The user's unread count changed
+            bump_mailbox(user.pk)
+        return bool(updated)
+
+    def mark_read_many(self, user, read_ids):
+        """Advance the user's cursors in several groups with one update
+        
+        ``read_ids`` maps group ids to the newest message the user has seen. Groups
+        without a row yet are skipped; unread_counts creates them caught up.
+        """
+        read_to = Case(
+            *[When(group_id=group_id, then=Value(message_id)) for group_id, message_id in read_ids.items()],
+            output_field=models.PositiveBigIntegerField(),
+        )
+        updated = self.filter(user=user, group__in=read_ids, last_read_id__lt=read_to).update(last_read_id=read_to)
+        if updated:
+            # The user's unread count changed
+            bump_mailbox(user.pk)
+        return updated
+
+
+class ChatMembership(models.Model):
+    """A user's membership of a group chat and how far they have read it
+    
+    In groups open to everyone or to admins the row only carries the read cursor.
+    """
+    
+    group = models.ForeignKey(ChatGroup, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='chat_memberships'
+    )
+    # Every group message with a higher id is unread for the member
+    last_read_id = models.PositiveBigIntegerField(default=0)
+    joined_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ChatMembershipQuerySet.as_manager()
+    
+    class Meta:
+        unique_together = ['user', 'group']
+    
+    def __str__(self):
+        return f"{self.user.username} in {self.group}"
+
+
+@receiver(post_save, sender=Message)
+def update_last_message(sender, instance, created, **kwargs):
+    """Move the conversation's last message pointer to a newly sent private message"""
+    if created and instance.conversation_id:
+        Conversation.objects.record_message(instance)
+
+
+# Keep cached group access in step with the tables
+@receiver(post_save, sender=ChatGroup)
+@receiver(post_delete, sender=ChatGroup)
+def clear_group_access(sender, instance, **kwargs):
+    """A group was added, changed or removed: every user's cached access is stale"""
+    bump_group_generation()
+
+
+@receiver(post_save, sender=ChatMembership)
+@receiver(post_delete, sender=ChatMembership)
+def clear_member_group_access(sender, instance, created=True, **kwargs):
+    """Drop the member's cached group access when they join or leave a group"""
+    if created:
+        invalidate_group_access(instance.user_id)
+
+
+@receiver(post_save, sender='moderation.Block')
+@receiver(post_delete, sender='moderation.Block')
+def refresh_blocked_mailboxes(sender, instance, **kwargs):
+    """A block hides or brings back unread messages, so both users' badges changed"""
+    bump_mailbox(instance.blocker_id, instance.blocked_id)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_user_messaging(sender, instance, **kwargs):
+    """Cascade a deleted user into the messaging database, which has no foreign keys to it"""
+    FirstContactTracker.objects.filter(Q(sender_id=instance.pk) | Q(receiver_id=instance.pk)).delete()
+    ChatMembership.objects.filter(user_id=instance.pk).delete()
+    ArchivedMessage.objects.filter(Q(sender_id=instance.pk) | Q(receiver_id=instance.pk)).delete()
+    Message.objects.filter(Q(sender_id=instance.pk) | Q(receiver_id=instance.pk)).delete()
+    Conversation.objects.filter(Q(user1_id=instance.pk) | Q(user2_id=instance.pk)).delete()
+
+
+@receiver(post_delete, sender=Competition)
+def delete_competition_groups(sender, instance, **kwargs):
+    """Remove a deleted competition's team channels, with their messages"""
+    ChatGroup.objects.filter(competition_id=instance.pk).delete()
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(timestamp, pk):
+    """Encode a (timestamp, id) position as an opaque cursor string"""
+    delta = timestamp - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f"{micros}-{pk}"
+
+
+def decode_cursor(value):
+    """Decode a cursor string back into (timestamp, id), or None if invalid"""
+    if not value:
+        return None
+    try:
+        micros, pk = value.split('-', 1)
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        return None
+
+
+def keyset_page(queryset, cursor, size, time_field='created_at', oldest_first=True):
+    """Fetch one page, newest first, positioned strictly before a decoded cursor
+    
+    Returns the items (oldest first unless ``oldest_first`` is False) and the
+    cursor for the next, older page, or None when there is nothing older.
+    """
+    if cursor:
+        before_time, before_id = cursor
+        # The redundant <= bound lets the database range-scan the (time, id) index
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__lte': before_time}),
+            Q(**{f'{time_field}__lt': before_time}) | Q(id__lt=before_id),
+        )
+    
+    items = list(queryset.order_by(f'-{time_field}', '-id')[:size + 1])
+    has_more = len(items) > size
+    items = items[:size]
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(getattr(items[-1], time_field), items[-1].pk)
+    if oldest_first:
+        items.reverse()
+    return items, next_cursor
@@ -0,0 +1,80 @@
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'messaging_message_fts'
+SEARCH_RESULT_LIMIT = 50
+
+# Highlight markers that cannot appear in escaped text, swapped for <mark> after escaping
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def fts_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, ``word*`` is a prefix"""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return ' '.join(terms)
+
+
+def fts_match_ids(text):
+    """Subquery of message ids whose content matches, for filtering querysets"""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [fts_query(text)])
+
+
+def highlight(snippet):
+    """Escape a snippet and turn the FTS markers into <mark> tags"""
+    html = escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def search_messages(user, text, group_ids, limit=SEARCH_RESULT_LIMIT):
+    """Ranked search over the user's conversations and accessible group chats
+
+    Returns messages best match first, each with a ``snippet`` of highlighted HTML.
+    """
+    from .models import Message
+
+    query = fts_query(text)
+    if not query:
+        return []
+
+    group_placeholders = ', '.join(['%s'] * len(group_ids)) or 'NULL'
+    sql = f"""
+        SELECT m.id, snippet({FTS_TABLE}, 0, %s, %s, '…', 24)
+        FROM {FTS_TABLE}
+        JOIN messaging_message m ON m.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+          AND (
+            m.conversation_id IN (
+                SELECT id FROM messaging_conversation WHERE user1_id = %s
+                UNION ALL
+                SELECT id FROM messaging_conversation WHERE user2_id = %s
+            )
+            OR (m.is_group_message AND m.group_id IN ({group_placeholders}))
+          )
+        ORDER BY {FTS_TABLE}.rank
+        LIMIT %s
+    """
+    params = [MARK_START, MARK_END, query, user.pk, user.pk, *group_ids, limit]
+
+    with connections[Message.objects.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    # Users live in the default database: prefetched, not joined
+    messages = Message.objects.select_related('conversation', 'group').prefetch_related(
+        'sender', 'receiver', 'conversation__user1', 'conversation__user2'
+    ).in_bulk([message_id for message_id, _ in rows])
+
+    results = []
+    for message_id, snippet in rows:
+        message = messages[message_id]
+        message.snippet = highlight(snippet)
+        results.append(message)
+    return results
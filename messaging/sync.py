@@ -0,0 +1,114 @@
+from django.db.models import Q
+from accounts.models import User
+from .groups import get_group_access
+
+SYNC_MAX_CURSORS = 20
+SYNC_MESSAGE_LIMIT = 200
+
+
+def sender_to_dict(sender):
+    """Sender fields of a message payload"""
+    return {
+        'sender_id': sender.id,
+        'sender': sender.username,
+        'sender_name': sender.get_full_name() or sender.username,
+        'is_admin': sender.is_admin,
+    }
+
+
+def parse_cursors(values):
+    """Turn ``key:last_id`` parameters into a dict of key to last seen message id
+
+    Malformed values are skipped, and only the first SYNC_MAX_CURSORS are kept.
+    """
+    cursors = {}
+    for value in values[:SYNC_MAX_CURSORS]:
+        key, _, last_id = value.rpartition(':')
+        if key and last_id.isdigit():
+            cursors[key] = int(last_id)
+    return cursors
+
+
+def collect_deltas(user, conversation_cursors, group_cursors):
+    """New messages in every watched conversation and group, from a fixed number of queries
+
+    Conversations are keyed by the other user's id, groups by slug. Returns a dict
+    of ``conversation:<id>`` / ``group:<slug>`` to message payloads, oldest first,
+    and whether more messages remain past SYNC_MESSAGE_LIMIT. Everything delivered
+    is marked read. Queries: the watched conversations, the messages of all
+    streams together, their senders (default database) and at most three
+    read cursor updates.
+    """
+    from .models import Conversation, Message, ChatMembership
+
+    streams = {}
+    deltas = {}
+
+    # Conversations are stored as canonical pairs, so each one is a unique index lookup
+    other_ids = {int(key): last_id for key, last_id in conversation_cursors.items() if key.isdigit()}
+    other_ids.pop(user.pk, None)
+    if other_ids:
+        pairs = Q()
+        for other_id in other_ids:
+            user1_id, user2_id = sorted((user.pk, other_id))
+            pairs |= Q(user1_id=user1_id, user2_id=user2_id)
+        for conversation in Conversation.objects.filter(pairs):
+            other_id = conversation.user2_id if conversation.user1_id == user.pk else conversation.user1_id
+            key = f'conversation:{other_id}'
+            streams[('conversation', conversation.pk)] = (key, conversation, other_ids[other_id])
+            deltas[key] = []
+        # Conversations that do not exist yet have nothing to deliver
+        for other_id in other_ids:
+            deltas.setdefault(f'conversation:{other_id}', [])
+
+    access = get_group_access(user)
+    for slug, last_id in group_cursors.items():
+        group = access.get(slug)
+        if group:
+            streams[('group', group.id)] = (f'group:{slug}', group, last_id)
+            deltas[f'group:{slug}'] = []
+
+    condition = Q()
+    for (kind, pk), (_, _, last_id) in streams.items():
+        if kind == 'conversation':
+            condition |= Q(conversation_id=pk, id__gt=last_id)
+        else:
+            condition |= Q(is_group_message=True, group_id=pk, id__gt=last_id)
+    if not condition:
+        return deltas, False
+
+    rows = list(Message.objects.filter(condition).order_by('id').values(
+        'id', 'conversation_id', 'group_id', 'sender_id', 'content', 'created_at'
+    )[:SYNC_MESSAGE_LIMIT + 1])
+    has_more = len(rows) > SYNC_MESSAGE_LIMIT
+    rows = rows[:SYNC_MESSAGE_LIMIT]
+
+    # Each sender is loaded and serialized once, however many messages they sent
+    senders = {
+        sender.id: sender_to_dict(sender)
+        for sender in User.objects.filter(pk__in={row['sender_id'] for row in rows}).only(
+            'id', 'username', 'first_name', 'last_name', 'role'
+        )
+    }
+
+    read_conversations, read_groups = {}, {}
+    for row in rows:
+        if row['conversation_id']:
+            key, conversation, _ = streams[('conversation', row['conversation_id'])]
+            read_conversations[conversation] = row['id']
+        else:
+            key, _, _ = streams[('group', row['group_id'])]
+            read_groups[row['group_id']] = row['id']
+        deltas[key].append(dict(
+            senders[row['sender_id']],
+            id=row['id'],
+            content=row['content'],
+            time=row['created_at'].strftime('%I:%M %p'),
+            is_mine=row['sender_id'] == user.pk,
+        ))
+
+    if read_conversations:
+        Conversation.objects.mark_read_many(user, read_conversations)
+    if read_groups:
+        ChatMembership.objects.mark_read_many(user, read_groups)
+    return deltas, has_more
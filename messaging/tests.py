@@ -1,3 +1,1008 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connections, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from core import ratelimit
+from competitions.models import Competition, Submission
+from moderation.blocks import get_block_set
+from moderation.models import Block
+from .archive import archive_batch
+from .batching import MessageBatcher
+from .broker import MessageBroker, broker, user_channel
+from . import views
+from .groups import get_group_access
+from .mailbox import mailbox_key
+from .models import Conversation, Message, ArchivedMessage, FirstContactTracker, ChatGroup, ChatMembership
+from .pagination import decode_cursor
 
-# Create your tests here.
+
+class InboxTests(TestCase):
+    """Inbox should be built from a constant number of queries"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def make_conversations(self, start, stop):
+        for i in range(start, stop):
+            other = User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass')
+            conv = Conversation.objects.create(user1=self.user, user2=other)
+            Message.objects.create(conversation=conv, sender=other, receiver=self.user, content=f'hi {i}')
+            Message.objects.create(conversation=conv, sender=other, receiver=self.user, content=f'latest {i}')
+
+    def count_inbox_queries(self):
+        self.client.force_login(self.user)
+        get_block_set(self.user)
+        views.group_unread_for(self.user)
+        with CaptureQueriesContext(connections['default']) as users, \
+                CaptureQueriesContext(connections['messaging']) as chat:
+            response = self.client.get(reverse('messaging:inbox'))
+        self.assertEqual(response.status_code, 200)
+        return len(users.captured_queries) + len(chat.captured_queries), response
+
+    def test_query_count_is_constant(self):
+        self.make_conversations(0, 2)
+        few, _ = self.count_inbox_queries()
+        self.make_conversations(2, 12)
+        many, _ = self.count_inbox_queries()
+        self.assertEqual(few, many)
+
+    def test_inbox_annotations(self):
+        self.make_conversations(0, 1)
+        _, response = self.count_inbox_queries()
+        conv_data = response.context['conversations'][0]
+        self.assertEqual(conv_data['unread_count'], 2)
+        self.assertEqual(conv_data['last_message_preview'], 'latest 0')
+        self.assertEqual(conv_data['other_user'].username, 'user0')
+        self.assertEqual(response.context['total_unread'], 2)
+
+    def test_keyset_pagination(self):
+        self.make_conversations(0, 25)
+        _, response = self.count_inbox_queries()
+        first_page = response.context['conversations']
+        self.assertEqual(len(first_page), 20)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+        response = self.client.get(reverse('messaging:inbox'), {'before': response.context['next_cursor']})
+        second_page = response.context['conversations']
+        self.assertEqual(len(second_page), 5)
+        self.assertIsNone(response.context['next_cursor'])
+
+        seen = {c['conversation'].pk for c in first_page} | {c['conversation'].pk for c in second_page}
+        self.assertEqual(len(seen), 25)
+
+    def test_pages_merge_both_sides_of_the_pair(self):
+        self.make_conversations(0, 3)
+        zed = User.objects.create_user('zed', 'zed@example.com', 'pass')
+        # Zed has the higher id against the first users and the lower one against the rest
+        others = list(User.objects.filter(username__startswith='user')) + [
+            User.objects.create_user(f'later{i}', f'later{i}@example.com', 'pass') for i in range(3)
+        ]
+        for other in others[::-1] + others[:2]:
+            conv = Conversation.objects.between(zed, other)
+            Message.objects.create(conversation=conv, sender=other, receiver=zed, content='hi')
+        self.assertTrue(Conversation.objects.filter(user1=zed).exists())
+        self.assertTrue(Conversation.objects.filter(user2=zed).exists())
+
+        seen, cursor = [], None
+        while True:
+            page, next_cursor = Conversation.objects.inbox_page(zed, cursor, 4)
+            seen += page
+            if not next_cursor:
+                break
+            cursor = decode_cursor(next_cursor)
+        expected = list(Conversation.objects.for_user(zed).order_by('-last_message_at', '-id'))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 6)
+
+    def test_last_message_pointer(self):
+        self.make_conversations(0, 3)
+        first = Conversation.objects.get(user2=User.objects.get(username='user0'))
+        latest = Message.objects.create(conversation=first, sender=self.user, receiver=first.user2, content='back')
+        first.refresh_from_db()
+        self.assertEqual(
+            (first.last_message_id, first.last_message_at, first.last_sender_id),
+            (latest.id, latest.created_at, self.user.id),
+        )
+        _, response = self.count_inbox_queries()
+        self.assertEqual(response.context['conversations'][0]['conversation'], first)
+        self.assertEqual(response.context['conversations'][0]['last_message_preview'], 'back')
+
+    def test_preview_of_archived_last_message(self):
+        self.make_conversations(0, 3)
+        first = Conversation.objects.get(user2=User.objects.get(username='user0'))
+        Message.objects.create(conversation=first, sender=self.user, receiver=first.user2, content='moved away')
+        # A newer message elsewhere, since the archiver always leaves the newest one live
+        Message.objects.create(
+            conversation=Conversation.objects.exclude(pk=first.pk).first(), sender=self.user,
+            receiver=User.objects.get(username='user1'), content='still live',
+        )
+        archive_batch(timezone.now() + timedelta(minutes=1), 1000)
+        self.assertFalse(Message.objects.filter(conversation=first).exists())
+
+        page, _ = Conversation.objects.inbox_page(self.user, None, 10)
+        previews = {conv.pk: conv.last_message_preview for conv in page}
+        self.assertEqual(previews[first.pk], 'moved away')
+
+    def test_repair_last_messages(self):
+        self.make_conversations(0, 3)
+        expected = dict(Conversation.objects.values_list('id', 'last_message_id'))
+        Conversation.objects.update(last_message_id=0, last_sender=None)
+        call_command('repair_last_messages', batch_size=2, pause=0, stdout=StringIO())
+        self.assertEqual(dict(Conversation.objects.values_list('id', 'last_message_id')), expected)
+        self.assertFalse(Conversation.objects.filter(last_sender=None).exists())
+
+
+class ReadCursorTests(TestCase):
+    """Marking a thread read is a single-row cursor update"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def setUp(self):
+        self.conv = Conversation.objects.create(user1=self.alice, user2=self.bob)
+        for i in range(5):
+            Message.objects.create(conversation=self.conv, sender=self.bob, receiver=self.alice, content=f'msg {i}')
+
+    def test_unread_counts_follow_cursor(self):
+        self.assertEqual(self.conv.unread_count(self.alice), 5)
+        self.assertEqual(self.conv.unread_count(self.bob), 0)
+        self.assertEqual(Message.objects.unread_for(self.alice).count(), 5)
+
+    def test_mark_read_is_one_update(self):
+        with self.assertNumQueries(1, using='messaging'):
+            self.conv.mark_read(self.alice)
+        self.conv.refresh_from_db()
+        self.assertEqual(self.conv.unread_count(self.alice), 0)
+        self.assertEqual(Message.objects.unread_for(self.alice).count(), 0)
+
+    def test_cursor_never_moves_backwards(self):
+        latest = self.conv.messages.order_by('-id').first()
+        self.conv.mark_read(self.alice)
+        self.assertEqual(self.conv.mark_read(self.alice, latest.id - 2), 0)
+        self.conv.refresh_from_db()
+        self.assertEqual(self.conv.user1_last_read_id, latest.id)
+
+
+class BrokerTests(TestCase):
+    """In-process publish/subscribe used by the live stream"""
+
+    def test_publish_reaches_subscribers_of_channel(self):
+        broker = MessageBroker()
+
+        async def scenario():
+            mine = broker.subscribe(['user:1', 'group:all'])
+            other = broker.subscribe(['user:2'])
+            broker.publish('user:1', {'id': 1})
+            broker.publish('group:all', {'id': 2})
+            received = [await asyncio.wait_for(mine.get(), 1) for _ in range(2)]
+            self.assertTrue(other.queue.empty())
+            mine.close()
+            other.close()
+            return received
+
+        self.assertEqual(asyncio.run(scenario()), [{'id': 1}, {'id': 2}])
+        self.assertEqual(broker._channels, {})
+
+
+class MessageStreamTests(TestCase):
+    """The live stream view frames published events and unsubscribes on disconnect"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_requires_login(self):
+        response = await self.async_client.get(reverse('messaging:stream'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_streams_published_message(self):
+        await self.async_client.aforce_login(self.alice)
+        response = await self.async_client.get(reverse('messaging:stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        frames = asyncio.Queue()
+
+        async def read():
+            async for chunk in response.streaming_content:
+                await frames.put(chunk.decode())
+
+        reader = asyncio.create_task(read())
+        # The stream subscribes before its first frame
+        self.assertEqual(await asyncio.wait_for(frames.get(), 1), 'retry: 3000\n\n')
+
+        broker.publish(user_channel(self.alice.pk), {
+            'message': {'id': 7, 'sender_id': self.alice.pk, 'content': 'Hi'},
+            'conversation_id': 3,
+            'receiver_id': self.bob.pk,
+            'group_id': None,
+        })
+        frame = await asyncio.wait_for(frames.get(), 1)
+        event, data = frame.split('\n')[:2]
+        self.assertEqual(event, 'event: message')
+        self.assertEqual(json.loads(data.removeprefix('data: ')), {
+            'id': 7, 'sender_id': self.alice.pk, 'content': 'Hi',
+            'is_mine': True, 'conversation_id': 3, 'group_id': None,
+        })
+
+        # A client disconnecting cancels the response, which must drop the subscription
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertNotIn(user_channel(self.alice.pk), broker._channels)
+
+
+class HistoryPaginationTests(TestCase):
+    """Conversation history loads the latest page and pages back with a cursor"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        cls.conv = Conversation.objects.create(user1=cls.alice, user2=cls.bob)
+        Message.objects.bulk_create([
+            Message(conversation=cls.conv, sender=cls.bob, receiver=cls.alice, content=f'msg {i}')
+            for i in range(120)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_history_pages_cover_every_message_once(self):
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('messaging:conversation', args=[self.bob.id]))
+        seen = [m.id for m in response.context['messages']]
+        self.assertEqual(len(seen), 50)
+        self.assertEqual(seen, sorted(seen))
+
+        cursor = response.context['history_cursor']
+        while cursor:
+            data = self.client.get(reverse('messaging:history'), {'user_id': self.bob.id, 'before': cursor}).json()
+            older = [m['id'] for m in data['messages']]
+            self.assertLess(max(older), min(seen))
+            seen = older + seen
+            cursor = data['next_cursor']
+
+        self.assertEqual(seen, list(self.conv.messages.order_by('id').values_list('id', flat=True)))
+
+
+class QueryPlanTests(TestCase):
+    """Every messaging hot query must be served by an index"""
+
+    databases = {'default', 'messaging'}
+
+    def test_no_full_table_scans(self):
+        call_command('check_query_plans', stdout=StringIO())
+
+
+class ConversationBetweenTests(TestCase):
+    """Conversations are looked up and created by their canonical user pair"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def test_either_order_returns_the_same_conversation(self):
+        self.assertIsNone(Conversation.objects.between(self.bob, self.alice, create=False))
+        conv = Conversation.objects.between(self.bob, self.alice)
+        self.assertEqual((conv.user1, conv.user2), (self.alice, self.bob))
+        self.assertEqual(Conversation.objects.between(self.alice.id, self.bob.id), conv)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_existing_lookup_is_one_query(self):
+        Conversation.objects.between(self.alice, self.bob)
+        with self.assertNumQueries(1, using='messaging'):
+            Conversation.objects.between(self.bob, self.alice)
+
+    def test_reversed_pair_is_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic(using='messaging'):
+            Conversation.objects.create(user1=self.bob, user2=self.alice)
+
+    def test_own_conversation_is_refused(self):
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('messaging:conversation', args=[self.alice.pk]))
+        self.assertRedirects(response, reverse('messaging:inbox'))
+        self.assertFalse(Conversation.objects.exists())
+
+
+class SendMessageTests(TestCase):
+    """send_message stays within its documented query budget"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def send(self, sender, receiver, content='hello'):
+        request = RequestFactory().post(reverse('messaging:send', args=[receiver.id]), {'content': content})
+        request.user = sender
+        request._messages = CookieStorage(request)
+        get_block_set(sender)
+        with CaptureQueriesContext(connections['messaging']) as ctx:
+            response = views.send_message(request, receiver.id)
+        self.assertEqual(response.status_code, 302)
+        statements = [
+            q['sql'] for q in ctx.captured_queries
+            if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+        ]
+        self.assertLessEqual(len(statements), views.SEND_MESSAGE_QUERY_BUDGET, statements)
+
+    def test_first_message_reply_and_established_thread(self):
+        self.send(self.alice, self.bob)
+        self.send(self.bob, self.alice)
+        self.send(self.alice, self.bob)
+        self.send(self.bob, self.alice)
+
+        conv = Conversation.objects.between(self.alice, self.bob, create=False)
+        self.assertEqual(conv.messages.count(), 4)
+        tracker = FirstContactTracker.objects.get(sender=self.alice, receiver=self.bob)
+        self.assertEqual((tracker.message_count, tracker.receiver_replied), (1, True))
+
+    def test_first_contact_limit(self):
+        for _ in range(5):
+            self.send(self.alice, self.bob)
+        self.assertEqual(Message.objects.filter(sender=self.alice).count(), 3)
+        tracker = FirstContactTracker.objects.get(sender=self.alice, receiver=self.bob)
+        self.assertEqual(tracker.message_count, 3)
+
+
+class BlockedUserTests(TestCase):
+    """Blocked users are filtered out in bulk and cannot be messaged"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        cls.carol = User.objects.create_user('carol', 'carol@example.com', 'pass')
+        Conversation.objects.between(cls.alice, cls.bob)
+        Conversation.objects.between(cls.alice, cls.carol)
+
+    def setUp(self):
+        cache.clear()
+        Block.objects.create(blocker=self.bob, blocked=self.alice)
+        self.client.force_login(self.alice)
+
+    def test_inbox_and_user_list_hide_blocked_users(self):
+        response = self.client.get(reverse('messaging:inbox'))
+        self.assertEqual([c['other_user'] for c in response.context['conversations']], [self.carol])
+        response = self.client.get(reverse('messaging:start'))
+        self.assertEqual(list(response.context['users']), [self.carol])
+
+    def test_cannot_send_to_user_who_blocked_you(self):
+        self.client.post(reverse('messaging:send', args=[self.bob.id]), {'content': 'hi'})
+        self.assertFalse(Message.objects.filter(sender=self.alice, receiver=self.bob).exists())
+
+    def test_unread_badge_skips_blocked_senders(self):
+        for sender in (self.bob, self.carol):
+            conv = Conversation.objects.between(self.alice, sender)
+            Message.objects.create(conversation=conv, sender=sender, receiver=self.alice, content='hi')
+        self.assertEqual(views.total_unread_for(self.alice), 1)
+
+        version = cache.get(mailbox_key(self.alice.pk))
+        Block.objects.create(blocker=self.alice, blocked=self.carol)
+        self.assertEqual(views.total_unread_for(self.alice), 0)
+        # The block changed the badge, so the next sync poll cannot be a 304
+        self.assertNotEqual(cache.get(mailbox_key(self.alice.pk)), version)
+
+
+class CheckNewConditionalTests(TestCase):
+    """check_new_messages answers unchanged polls with 304 from the cache alone"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.alice)
+        self.url = reverse('messaging:check_new')
+
+    def test_unchanged_mailbox_returns_304_without_message_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connections['messaging']) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(ctx.captured_queries, [])
+
+    def test_new_message_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(using='messaging', execute=True):
+            self.client.force_login(self.bob)
+            self.client.post(reverse('messaging:send', args=[self.alice.id]), {'content': 'hi'})
+
+        self.client.force_login(self.alice)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_unread'], 1)
+
+
+class MessageSearchTests(TestCase):
+    """Full-text search is ranked, highlighted and scoped to what the user can read"""
+
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        cls.carol = User.objects.create_user('carol', 'carol@example.com', 'pass')
+        conv = Conversation.objects.between(cls.alice, cls.bob)
+        other = Conversation.objects.between(cls.bob, cls.carol)
+        Message.objects.create(conversation=conv, sender=cls.bob, receiver=cls.alice, content='Practice <b>graphs</b> tonight')
+        Message.objects.create(conversation=other, sender=cls.bob, receiver=cls.carol, content='Secret graphs plan')
+        everyone, admins = ChatGroup.objects.get(slug='all'), ChatGroup.objects.get(slug='admin')
+        Message.objects.create(sender=cls.carol, content='Graphs workshop on Friday', is_group_message=True, group=everyone)
+        Message.objects.create(sender=cls.carol, content='Admin graphs notes', is_group_message=True, group=admins)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.alice)
+
+    def test_results_are_scoped_and_highlighted(self):
+        response = self.client.get(reverse('messaging:search'), {'q': 'graph'})
+        contents = sorted(msg.content for msg in response.context['results'])
+        self.assertEqual(contents, ['Graphs workshop on Friday', 'Practice <b>graphs</b> tonight'])
+        self.assertContains(response, '&lt;b&gt;<mark>graphs</mark>&lt;/b&gt;', html=False)
+
+    def test_index_follows_edits_and_deletes(self):
+        msg = Message.objects.get(content__startswith='Practice')
+        msg.content = 'Practice trees tonight'
+        msg.save()
+        response = self.client.get(reverse('messaging:search'), {'q': 'trees'})
+        self.assertEqual([m.id for m in response.context['results']], [msg.id])
+        msg.delete()
+        response = self.client.get(reverse('messaging:search'), {'q': 'trees'})
+        self.assertEqual(response.context['results'], [])
+
+    def test_query_syntax_is_escaped(self):
+        response = self.client.get(reverse('messaging:search'), {'q': '"graphs OR ( NEAR'})
+        self.assertEqual(response.status_code, 200)
+
+
+class MessagingDatabaseTests(TestCase):
+    """Messaging lives in its own database and still follows users in default"""
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def test_tables_are_split_between_databases(self):
+        self.assertEqual(Message.objects.db, 'messaging')
+        self.assertIn('messaging_message', connections['messaging'].introspection.table_names())
+        self.assertNotIn('messaging_message', connections['default'].introspection.table_names())
+        self.assertNotIn('accounts_user', connections['messaging'].introspection.table_names())
+
+    def test_users_resolve_across_databases(self):
+        conv = Conversation.objects.between(self.alice, self.bob)
+        Message.objects.create(conversation=conv, sender=self.bob, receiver=self.alice, content='hi')
+        msg = Message.objects.prefetch_related('sender').get()
+        self.assertEqual(msg.sender, self.bob)
+        self.assertEqual(msg.sender._state.db, 'default')
+
+    def test_deleting_a_user_removes_their_messaging_rows(self):
+        conv = Conversation.objects.between(self.alice, self.bob)
+        Message.objects.create(conversation=conv, sender=self.bob, receiver=self.alice, content='hi')
+        FirstContactTracker.objects.create(sender=self.bob, receiver=self.alice, message_count=1)
+        self.bob.delete()
+        self.assertFalse(Conversation.objects.exists())
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(FirstContactTracker.objects.exists())
+
+
+class SplitMessagingDbTests(TransactionTestCase):
+    """Messaging rows left in default move once, and the command is safe to run on every release"""
+    databases = {'default', 'messaging'}
+
+    moved_models = [Conversation, FirstContactTracker, Message]
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        # Messaging tables as they were before the move, in the default database.
+        # Messages point at chat groups, so that table has to exist for inserts
+        with connections['default'].schema_editor() as editor:
+            for model in [ChatGroup] + self.moved_models:
+                editor.create_model(model)
+        self.addCleanup(self.drop_old_tables)
+
+        conv = Conversation(pk=1, user1=self.alice, user2=self.bob)
+        Conversation.objects.using('default').bulk_create([conv])
+        Message.objects.using('default').bulk_create([
+            Message(pk=i, conversation=conv, sender=self.alice, receiver=self.bob, content=f'old {i}')
+            for i in range(1, 4)
+        ])
+
+    def drop_old_tables(self):
+        tables = set(connections['default'].introspection.table_names())
+        with connections['default'].cursor() as cursor:
+            for model in reversed([ChatGroup] + self.moved_models):
+                for table in (model._meta.db_table, model._meta.db_table + '_moved'):
+                    if table in tables:
+                        cursor.execute(f'DROP TABLE {table}')
+
+    def test_moves_once_then_does_nothing(self):
+        call_command('split_messaging_db', stdout=StringIO())
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['old 1', 'old 2', 'old 3'])
+        self.assertNotIn('messaging_message', connections['default'].introspection.table_names())
+
+        # A message sent after the move does not stop the next release
+        Message.objects.create(
+            conversation=Conversation.objects.get(), sender=self.bob, receiver=self.alice, content='new',
+        )
+        out = StringIO()
+        call_command('split_messaging_db', stdout=out)
+        self.assertIn('nothing to move', out.getvalue())
+        self.assertEqual(Message.objects.count(), 4)
+
+
+class GroupWriteBehindTests(TransactionTestCase):
+    """Buffered group sends commit together and are durable before the response"""
+    databases = {'default', 'messaging'}
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        # Flushing between tests also removes the groups seeded by the migration
+        self.group, _ = ChatGroup.objects.get_or_create(
+            slug='all', defaults={'name': 'All Members', 'audience': ChatGroup.AUDIENCE_EVERYONE}
+        )
+
+    def test_concurrent_sends_share_one_commit(self):
+        batcher = MessageBatcher(window=0.2)
+        messages = [
+            Message(sender=self.alice, content=f'burst {i}', is_group_message=True, group=self.group)
+            for i in range(5)
+        ]
+        futures = [batcher.submit(message) for message in messages]
+        saved = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(batcher.batches_flushed, 1)
+        self.assertTrue(all(message.pk for message in saved))
+        self.assertEqual(Message.objects.filter(is_group_message=True).count(), 5)
+
+    @override_settings(MESSAGING_GROUP_BATCHING=True)
+    def test_view_returns_after_message_is_committed(self):
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse('messaging:send_group', args=['all']), {'content': 'hello all'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Message.objects.filter(content='hello all', is_group_message=True).exists())
+
+    def stall(self, batcher):
+        """Park the batcher on a live thread that never flushes"""
+        release = threading.Event()
+        batcher._thread = threading.Thread(target=release.wait, daemon=True)
+        batcher._thread.start()
+        self.addCleanup(release.set)
+
+    def test_stalled_flusher_falls_back_to_a_direct_save(self):
+        published = []
+        batcher = MessageBatcher(published=published.append)
+        self.stall(batcher)
+        message = Message(sender=self.alice, content='stuck', is_group_message=True, group=self.group)
+        batcher.save(message, timeout=0.05)
+
+        self.assertIsNotNone(message.pk)
+        self.assertEqual(published, [message])
+        self.assertEqual(batcher.batches_flushed, 0)
+        self.assertEqual(Message.objects.filter(content='stuck').count(), 1)
+
+    def test_dead_flusher_is_restarted(self):
+        batcher = MessageBatcher()
+        batcher._thread = threading.Thread(target=lambda: None)
+        batcher._thread.start()
+        batcher._thread.join()
+        message = Message(sender=self.alice, content='revived', is_group_message=True, group=self.group)
+        batcher.save(message, timeout=5)
+        self.assertEqual(batcher.batches_flushed, 1)
+
+    @override_settings(MESSAGING_GROUP_BATCHING=True)
+    def test_view_returns_503_when_the_batch_is_stuck_in_flight(self):
+        self.client.force_login(self.alice)
+        with mock.patch.object(views.group_message_batcher, 'save', side_effect=FutureTimeoutError):
+            response = self.client.post(reverse('messaging:send_group', args=['all']), {'content': 'hello all'})
+        self.assertEqual(response.status_code, 503)
+
+
+class GroupReadCursorTests(TestCase):
+    """Group traffic counts toward the unread badge through per-member cursors"""
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        cls.group = ChatGroup.objects.get(slug='all')
+        Message.objects.create(sender=cls.bob, content='old news', is_group_message=True, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.alice)
+
+    def post_group(self, sender, content):
+        return Message.objects.create(sender=sender, content=content, is_group_message=True, group=self.group)
+
+    def test_new_member_starts_caught_up(self):
+        self.assertEqual(views.group_unread_for(self.alice), {self.group.id: 0})
+        self.post_group(self.bob, 'fresh')
+        self.post_group(self.alice, 'my own message')
+        self.assertEqual(views.group_unread_for(self.alice), {self.group.id: 1})
+        self.assertEqual(views.total_unread_for(self.alice), 1)
+
+    def test_group_unread_is_one_query(self):
+        views.group_unread_for(self.alice)
+        self.post_group(self.bob, 'fresh')
+        with self.assertNumQueries(1, using='messaging'):
+            counts = ChatMembership.objects.unread_counts(self.alice, [self.group.id])
+        self.assertEqual(counts, {self.group.id: 1})
+
+    def test_opening_and_polling_the_chat_marks_it_read(self):
+        views.group_unread_for(self.alice)
+        self.post_group(self.bob, 'fresh')
+        self.client.get(reverse('messaging:group_chat', args=['all']))
+        self.assertEqual(views.total_unread_for(self.alice), 0)
+
+        latest = self.post_group(self.bob, 'while watching')
+        data = self.client.get(reverse('messaging:check_new'), {'group': 'all', 'last_check': latest.id - 1}).json()
+        self.assertEqual([m['id'] for m in data['new_messages']], [latest.id])
+        self.assertEqual(data['total_unread'], 0)
+
+    def test_cursor_never_moves_backwards(self):
+        latest = self.post_group(self.bob, 'fresh')
+        self.assertTrue(ChatMembership.objects.mark_read(self.alice, self.group.id))
+        self.assertFalse(ChatMembership.objects.mark_read(self.alice, self.group.id, latest.id - 1))
+        self.assertEqual(ChatMembership.objects.get(user=self.alice).last_read_id, latest.id)
+
+
+class ChatGroupTests(TestCase):
+    """Team channels: membership decides access, which is cached per user"""
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', role='admin')
+        cls.team = ChatGroup.objects.create(slug='team-red', name='Team Red')
+
+    def setUp(self):
+        cache.clear()
+
+    def slugs(self, user):
+        return [group.slug for group in get_group_access(user).groups]
+
+    def test_audience_decides_access(self):
+        self.team.set_members([self.alice.id])
+        self.assertEqual(self.slugs(self.alice), ['all', 'team-red'])
+        self.assertEqual(self.slugs(self.bob), ['all'])
+        self.assertEqual(self.slugs(self.admin), ['all', 'admin'])
+
+    def test_access_is_cached_until_membership_or_groups_change(self):
+        self.assertEqual(self.slugs(self.bob), ['all'])
+        with self.assertNumQueries(0, using='messaging'):
+            self.assertEqual(self.slugs(self.bob), ['all'])
+
+        self.team.set_members([self.bob.id])
+        self.assertEqual(self.slugs(self.bob), ['all', 'team-red'])
+
+        self.team.audience = ChatGroup.AUDIENCE_ADMINS
+        self.team.save()
+        self.assertEqual(self.slugs(self.bob), ['all'])
+        self.assertEqual(self.slugs(self.admin), ['all', 'admin', 'team-red'])
+
+    def test_non_members_are_turned_away(self):
+        self.client.force_login(self.bob)
+        response = self.client.post(reverse('messaging:send_group', args=['team-red']), {'content': 'let me in'})
+        self.assertRedirects(response, reverse('messaging:inbox'))
+        self.assertFalse(Message.objects.filter(group=self.team).exists())
+
+    def test_a_message_is_one_row_for_any_number_of_members(self):
+        members = [
+            User.objects.create_user(f'member{i}', f'member{i}@example.com', 'pass') for i in range(20)
+        ]
+        self.team.set_members([self.alice.id] + [member.id for member in members])
+        self.client.force_login(self.alice)
+        with CaptureQueriesContext(connections['messaging']) as ctx:
+            self.client.post(reverse('messaging:send_group', args=['team-red']), {'content': 'go team'})
+        inserts = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(views.group_unread_for(members[0])[self.team.id], 1)
+
+    def test_inbox_lists_groups_with_unread_counts(self):
+        self.team.set_members([self.alice.id, self.bob.id])
+        Message.objects.create(sender=self.bob, content='hello team', is_group_message=True, group=self.team)
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('messaging:inbox'))
+        counts = {data['group'].slug: data['unread_count'] for data in response.context['groups']}
+        self.assertEqual(counts, {'all': 0, 'team-red': 1})
+
+    def test_sync_team_channels(self):
+        competition = Competition.objects.create(
+            title='Spring Cup', description='', start_date=timezone.now(), end_date=timezone.now(), created_by=self.admin
+        )
+        Submission.objects.create(competition=competition, user=self.alice, solution='print(1)')
+        call_command('sync_team_channels', stdout=StringIO())
+
+        group = ChatGroup.objects.get(competition_id=competition.pk)
+        self.assertEqual(
+            set(group.memberships.values_list('user_id', flat=True)), {self.alice.id, self.admin.id}
+        )
+        self.assertIn(group.slug, self.slugs(self.alice))
+        competition.delete()
+        self.assertFalse(ChatGroup.objects.filter(pk=group.pk).exists())
+
+
+class DeltaSyncTests(TestCase):
+    """One sync poll delivers every watched stream and the badge from a fixed number of queries"""
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.others = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pass') for i in range(3)]
+        cls.group = ChatGroup.objects.get(slug='all')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.alice)
+        get_block_set(self.alice)
+        views.group_unread_for(self.alice)
+
+    def send(self, sender, content):
+        conv = Conversation.objects.between(sender, self.alice)
+        return Message.objects.create(conversation=conv, sender=sender, receiver=self.alice, content=content)
+
+    def sync(self, conversations=(), groups=(), **headers):
+        return self.client.get(reverse('messaging:sync'), {
+            'conversation': [f'{user.id}:0' for user in conversations],
+            'group': [f'{slug}:0' for slug in groups],
+        }, **headers)
+
+    def count_queries(self, **streams):
+        with CaptureQueriesContext(connections['default']) as users, \
+                CaptureQueriesContext(connections['messaging']) as chat:
+            response = self.sync(**streams)
+        self.assertEqual(response.status_code, 200)
+        return len(users.captured_queries) + len(chat.captured_queries), response.json()
+
+    def test_deltas_for_every_stream_and_badge(self):
+        first = self.send(self.others[0], 'hi from 0')
+        self.send(self.others[1], 'hi from 1')
+        Message.objects.create(sender=self.others[2], content='hi all', is_group_message=True, group=self.group)
+
+        _, data = self.count_queries(conversations=self.others[:1], groups=['all', 'admin'])
+        self.assertEqual([m['id'] for m in data['messages'][f'conversation:{self.others[0].id}']], [first.id])
+        self.assertEqual([m['content'] for m in data['messages']['group:all']], ['hi all'])
+        self.assertNotIn('group:admin', data['messages'])
+        # Delivered messages are read; the unwatched conversation still counts
+        self.assertEqual(data['total_unread'], 1)
+
+    def test_query_count_does_not_grow_with_streams(self):
+        for user in self.others:
+            self.send(user, 'hello')
+            self.send(user, 'again')
+        few, _ = self.count_queries(conversations=self.others[:1])
+        for user in self.others:
+            self.send(user, 'more')
+        Message.objects.create(sender=self.others[0], content='hi all', is_group_message=True, group=self.group)
+        many, data = self.count_queries(conversations=self.others, groups=['all'])
+        self.assertEqual(few + 1, many)  # the group read cursor update
+        self.assertEqual(len(data['messages'][f'conversation:{self.others[2].id}']), 3)
+
+    def test_large_responses_are_compressed(self):
+        for i in range(20):
+            self.send(self.others[0], f'message number {i} ' * 5)
+        response = self.sync(conversations=self.others[:1], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        # The first poll marked everything read, which changed the mailbox
+        etag = self.sync(conversations=self.others[:1], HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        response = self.sync(conversations=self.others[:1], HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class MessageArchiveTests(TestCase):
+    """Old messages move to the compressed archive in batches and history reads through it"""
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        cls.conv = Conversation.objects.between(cls.alice, cls.bob)
+        Message.objects.bulk_create([
+            Message(conversation=cls.conv, sender=cls.bob, receiver=cls.alice, content=f'msg {i} ' * 20)
+            for i in range(120)
+        ])
+        cls.ids = list(Message.objects.order_by('id').values_list('id', flat=True))
+        Message.objects.filter(id__in=cls.ids[:100]).update(created_at=timezone.now() - timezone.timedelta(days=400))
+
+    def setUp(self):
+        cache.clear()
+
+    def archive(self, **options):
+        call_command('archive_messages', days=365, batch_size=30, pause=0, stdout=StringIO(), **options)
+
+    def test_old_messages_move_in_batches(self):
+        self.archive()
+        self.assertEqual(list(ArchivedMessage.objects.order_by('id').values_list('id', flat=True)), self.ids[:100])
+        self.assertEqual(Message.objects.count(), 20)
+        archived = ArchivedMessage.objects.get(pk=self.ids[0])
+        self.assertEqual(archived.content, 'msg 0 ' * 20)
+        self.assertLess(len(archived.compressed_content), len(archived.content))
+
+    def test_newest_message_is_never_archived(self):
+        Message.objects.update(created_at=timezone.now() - timezone.timedelta(days=400))
+        self.archive()
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [self.ids[-1]])
+
+    def test_history_reads_through_the_archive(self):
+        self.archive()
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('messaging:conversation', args=[self.bob.id]))
+        seen = [m.id for m in response.context['messages']]
+        cursor = response.context['history_cursor']
+        while cursor:
+            data = self.client.get(reverse('messaging:history'), {'user_id': self.bob.id, 'before': cursor}).json()
+            seen = [m['id'] for m in data['messages']] + seen
+            cursor = data['next_cursor']
+        self.assertEqual(seen, self.ids)
+
+
+class MessageVacuumTests(TransactionTestCase):
+    """Archiving only hands space back once incremental auto-vacuum was switched on"""
+    databases = {'default', 'messaging'}
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        self.conv = Conversation.objects.between(self.alice, self.bob)
+
+    def pragma(self, name):
+        with connections['messaging'].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def archive_old_messages(self, **options):
+        Message.objects.bulk_create([
+            Message(conversation=self.conv, sender=self.bob, receiver=self.alice, content=f'msg {i} ' * 200)
+            for i in range(300)
+        ])
+        Message.objects.update(created_at=timezone.now() - timedelta(days=400))
+        out = StringIO()
+        call_command('archive_messages', days=365, batch_size=100, pause=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_freelist_shrinks_once_enabled(self):
+        out = self.archive_old_messages()
+        self.assertIn('freed 0 pages', out)
+        self.assertGreater(self.pragma('freelist_count'), 0)
+        self.assertNotEqual(self.pragma('auto_vacuum'), 2)
+
+        out = self.archive_old_messages(enable_incremental_vacuum=True)
+        self.assertIn('Switched to incremental auto-vacuum', out)
+        self.assertEqual(self.pragma('auto_vacuum'), 2)
+        self.assertEqual(self.pragma('freelist_count'), 0)
+        self.assertNotIn('freed 0 pages', out)
+
+
+@override_settings(RATE_LIMITS={'messaging.send': (2, 60), 'messaging.poll': (3, 60)})
+class RateLimitTests(TestCase):
+    """Sends and polls over budget are refused before any database work"""
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+
+    def setUp(self):
+        # Limiters remember counts per process; start every test from an empty window
+        cache.clear()
+        ratelimit._limiters.clear()
+        self.client.force_login(self.alice)
+
+    def test_send_over_budget(self):
+        url = reverse('messaging:send', args=[self.bob.id])
+        for content in ('one', 'two'):
+            self.assertEqual(self.client.post(url, {'content': content}).status_code, 302)
+        response = self.client.post(url, {'content': 'three'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_poll_over_budget_skips_database(self):
+        url = reverse('messaging:check_new')
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connections['messaging']) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+    def test_budgets_are_per_user(self):
+        url = reverse('messaging:check_new')
+        for _ in range(4):
+            self.client.get(url)
+        self.client.force_login(self.bob)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class UserPickerTests(TestCase):
+    """The new conversation picker is paginated, searchable and hides blocked users"""
+    databases = {'default', 'messaging'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.others = [User.objects.create_user(f'user{i:02}', f'user{i}@example.com', 'pass') for i in range(30)]
+        Block.objects.create(blocker=cls.alice, blocked=cls.others[0])
+        Block.objects.create(blocker=cls.others[1], blocked=cls.alice)
+
+    def setUp(self):
+        self.client.force_login(self.alice)
+
+    def pick(self, **params):
+        response = self.client.get(reverse('messaging:start'), params)
+        return [user.username for user in response.context['users']], response.context['next_after']
+
+    def test_pages_skip_blocked_users(self):
+        first, next_after = self.pick()
+        self.assertEqual(len(first), views.USER_PICKER_PAGE_SIZE)
+        self.assertNotIn('user00', first)
+        self.assertNotIn('user01', first)
+        second, next_after = self.pick(after=next_after)
+        self.assertIsNone(next_after)
+        self.assertEqual(len(first) + len(second), 28)
+
+    def test_search(self):
+        self.assertEqual(self.pick(q='USER2'), ([f'user2{i}' for i in range(10)], None))
+        self.assertEqual(self.pick(q='user01'), ([], None))
+
+    def test_query_count(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.pick(q='user')
+        # Session, user and one page of users with the block anti-join
+        self.assertEqual(len(queries.captured_queries), 3)
@@ -1,76 +1,171 @@
+import asyncio
+import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages as django_messages
-from django.http import JsonResponse
-from django.db.models import Q, Max
-from django.utils import timezone
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Exists, Subquery
+from django.utils.cache import patch_cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from accounts.models import User
-from .models import Conversation, Message, FirstContactTracker
+from accounts.presence import attach_presence
+from core.ratelimit import rate_limit
+from moderation.blocks import exclude_blocked, get_block_set
+from .archive import history_page
+from .batching import MessageBatcher
+from .broker import broker, user_channel, group_channel
+from .groups import get_group_access
+from .mailbox import bump_mailbox, bump_group, mailbox_etag
+from .models import Conversation, Message, ArchivedMessage, FirstContactTracker, ChatGroup, ChatMembership
+from .pagination import decode_cursor
+from .search import search_messages
+from .sync import collect_deltas, parse_cursors, sender_to_dict
+
+INBOX_PAGE_SIZE = 20
+HISTORY_PAGE_SIZE = 50
+FIRST_CONTACT_LIMIT = 3
+SEND_MESSAGE_QUERY_BUDGET = 5
+USER_PICKER_PAGE_SIZE = 25
+STREAM_KEEPALIVE_SECONDS = 15
+
+def message_to_dict(msg):
+    """JSON-friendly message payload shared by polling and the live stream"""
+    return dict(
+        sender_to_dict(msg.sender),
+        id=msg.id,
+        content=msg.content,
+        time=msg.created_at.strftime('%I:%M %p'),
+    )
+
+def publish_message(msg):
+    """Once the message is committed, bump mailbox versions and push it to live subscribers"""
+    event = {
+        'message': message_to_dict(msg),
+        'conversation_id': msg.conversation_id,
+        'receiver_id': msg.receiver_id,
+        'group_id': msg.group_id,
+    }
+    if msg.is_group_message:
+        channels = [group_channel(msg.group_id)]
+    else:
+        channels = [user_channel(msg.sender_id), user_channel(msg.receiver_id)]
+    
+    def send():
+        if msg.is_group_message:
+            bump_group(msg.group_id)
+        else:
+            bump_mailbox(msg.sender_id, msg.receiver_id)
+        for channel in channels:
+            broker.publish(channel, event)
+    transaction.on_commit(send, using=Message.objects.db)
+
+# Shared by every request in the process, so concurrent group sends share a commit
+group_message_batcher = MessageBatcher(
+    window=settings.MESSAGING_GROUP_BATCH_WINDOW,
+    max_size=settings.MESSAGING_GROUP_BATCH_SIZE,
+    published=publish_message,
+)
+
+def readable_group(request, slug):
+    """The group chat with this slug if the user can read it, else None with an error message"""
+    group = get_group_access(request.user).get(slug)
+    if group is None:
+        if ChatGroup.objects.filter(slug=slug).exists():
+            django_messages.error(request, 'You do not have access to this group chat.')
+        else:
+            django_messages.error(request, 'Invalid group chat.')
+    return group
+
+def group_unread_for(user):
+    """Unread message count in each group chat the user can read, by group id"""
+    return ChatMembership.objects.unread_counts(user, get_group_access(user).ids)
+
+def total_unread_for(user):
+    """Unread private and group messages, for the unread badge"""
+    return Message.objects.unread_for(user).count() + sum(group_unread_for(user).values())
 
 @login_required
 def inbox(request):
     """View all conversations"""
-    # Get all conversations involving current user
-    conversations = Conversation.objects.filter(
-        Q(user1=request.user) | Q(user2=request.user)
-    ).annotate(
-        last_message_time=Max('messages__created_at')
-    ).order_by('-last_message_time')
-    
-    # Calculate unread counts
+    # Blocks live in the default database, so they cannot be joined here; the cached
+    # block set drops every blocked conversation in the same queries that pick the page
+    blocked_ids = get_block_set(request.user).user_ids
+    conversations = Conversation.objects.exclude(
+        Q(user1__in=blocked_ids) | Q(user2__in=blocked_ids)
+    )
+    
+    # Keyset pagination: continue after the last conversation of the previous page.
+    # The page is chosen from the stored last activity; only its conversations are annotated
+    page, next_cursor = conversations.inbox_page(
+        request.user,
+        decode_cursor(request.GET.get('before')),
+        INBOX_PAGE_SIZE,
+    )
+    
     conv_list = []
-    for conv in conversations:
-        other_user = conv.get_other_user(request.user)
-        unread = conv.unread_count(request.user)
+    for conv in page:
         conv_list.append({
             'conversation': conv,
-            'other_user': other_user,
-            'unread_count': unread,
+            'other_user': conv.get_other_user(request.user),
+            'unread_count': conv.unread,
+            'last_message_time': conv.last_message_at if conv.last_message_id else None,
+            'last_message_preview': conv.last_message_preview,
         })
     
+    # Every readable group with its unread count, from one query
+    group_unread = group_unread_for(request.user)
+    groups = [
+        {'group': group, 'unread_count': group_unread[group.id]}
+        for group in get_group_access(request.user).groups
+    ]
+    total_unread = Message.objects.unread_for(request.user).count() + sum(group_unread.values())
+    
     context = {
         'conversations': conv_list,
-        'total_unread': sum(c['unread_count'] for c in conv_list),
+        'groups': groups,
+        'total_unread': total_unread,
+        'next_cursor': next_cursor,
     }
     return render(request, 'messaging/inbox.html', context)
 
 @login_required
 def conversation_view(request, user_id):
     """View conversation with a specific user"""
+    if user_id == request.user.id:
+        django_messages.error(request, 'You cannot message yourself.')
+        return redirect('messaging:inbox')
+    
     other_user = get_object_or_404(User, pk=user_id)
+    attach_presence([other_user])
     
     # Check if blocked
-    from moderation.models import Block
-    if Block.objects.filter(blocker=other_user, blocked=request.user).exists():
+    blocks = get_block_set(request.user)
+    if other_user.id in blocks.blocked_by:
         django_messages.error(request, 'You cannot message this user.')
         return redirect('messaging:inbox')
     
-    if Block.objects.filter(blocker=request.user, blocked=other_user).exists():
+    if other_user.id in blocks.blocking:
         django_messages.error(request, 'You have blocked this user.')
         return redirect('messaging:inbox')
     
     # Get or create conversation
-    conversation = Conversation.objects.filter(
-        Q(user1=request.user, user2=other_user) | 
-        Q(user1=other_user, user2=request.user)
-    ).first()
-    
-    if not conversation:
-        # Ensure user1 is always the one with lower ID for consistency
-        if request.user.id < other_user.id:
-            conversation = Conversation.objects.create(user1=request.user, user2=other_user)
-        else:
-            conversation = Conversation.objects.create(user1=other_user, user2=request.user)
+    conversation = Conversation.objects.between(request.user, other_user)
     
     # Mark messages as read
-    Message.objects.filter(
-        conversation=conversation,
-        receiver=request.user,
-        is_read=False
-    ).update(is_read=True)
-    
-    # Get messages
-    conv_messages = conversation.messages.select_related('sender').all()
+    conversation.mark_read(request.user)
+    
+    # Get the most recent messages; older ones are fetched on scroll
+    conv_messages, history_cursor = history_page(
+        conversation.messages.prefetch_related('sender'),
+        conversation.archived_messages.prefetch_related('sender'),
+        None,
+        HISTORY_PAGE_SIZE,
+    )
     
     # Check first contact status
     first_contact = FirstContactTracker.objects.filter(
@@ -92,18 +187,64 @@ def conversation_view(request, user_id):
         'conversation': conversation,
         'other_user': other_user,
         'messages': conv_messages,
+        'last_message_id': conv_messages[-1].id if conv_messages else 0,
+        'history_cursor': history_cursor,
         'can_send': can_send,
         'message_limit_warning': message_limit_warning,
     }
     return render(request, 'messaging/conversation.html', context)
 
+def recipient_for_send(sender, user_id):
+    """Fetch the recipient along with the messaging state send_message needs
+    
+    One read per database: the user from default, then the existing conversation
+    annotated with the sender's first contact tracker state and whether a reply
+    is owed to the recipient.
+    """
+    other_user = get_object_or_404(User, pk=user_id)
+    user1_id, user2_id = sorted((sender.id, user_id))
+    sent_tracker = FirstContactTracker.objects.filter(sender=sender, receiver_id=user_id)
+    
+    state = Conversation.objects.filter(user1_id=user1_id, user2_id=user2_id).annotate(
+        sent_count=Subquery(sent_tracker.values('message_count')[:1]),
+        sent_replied=Subquery(sent_tracker.values('receiver_replied')[:1]),
+        reply_owed=Exists(FirstContactTracker.objects.filter(
+            sender_id=user_id, receiver=sender, receiver_replied=False
+        )),
+    ).values('sent_count', 'sent_replied', 'reply_owed', existing_conversation_id=F('pk')).first()
+    
+    # Trackers are only created together with their conversation, so no
+    # conversation means no trackers either
+    if state is None:
+        state = {
+            'existing_conversation_id': None,
+            'sent_count': None,
+            'sent_replied': None,
+            'reply_owed': False,
+        }
+    for name, value in state.items():
+        setattr(other_user, name, value)
+    return other_user
+
 @login_required
+@rate_limit('messaging.send')
 def send_message(request, user_id):
-    """Send a message to a user"""
+    """Send a message to a user
+    
+    Query budget: at most SEND_MESSAGE_QUERY_BUDGET statements on the messaging
+    database (not counting transaction control), all inside one transaction, plus
+    the recipient lookup in default and a block cache miss. One annotated read,
+    then only the writes this message actually needs: the conversation (first
+    message only), the first contact trackers, the message and the conversation's
+    last message pointer.
+    """
     if request.method != 'POST':
         return redirect('messaging:conversation', user_id=user_id)
     
-    other_user = get_object_or_404(User, pk=user_id)
+    if user_id == request.user.id:
+        django_messages.error(request, 'You cannot message yourself.')
+        return redirect('messaging:inbox')
+    
     content = request.POST.get('content', '').strip()
     
     if not content:
@@ -111,139 +252,201 @@ def send_message(request, user_id):
         return redirect('messaging:conversation', user_id=user_id)
     
     # Check if blocked
-    from moderation.models import Block
-    if Block.objects.filter(Q(blocker=other_user, blocked=request.user) | Q(blocker=request.user, blocked=other_user)).exists():
+    if get_block_set(request.user).involves(user_id):
         django_messages.error(request, 'Cannot send message.')
         return redirect('messaging:conversation', user_id=user_id)
     
-    # Get or create conversation
-    conversation = Conversation.objects.filter(
-        Q(user1=request.user, user2=other_user) | 
-        Q(user1=other_user, user2=request.user)
-    ).first()
-    
-    if not conversation:
-        if request.user.id < other_user.id:
-            conversation = Conversation.objects.create(user1=request.user, user2=other_user)
-        else:
-            conversation = Conversation.objects.create(user1=other_user, user2=request.user)
+    other_user = recipient_for_send(request.user, user_id)
     
     # Check first contact limit
-    first_contact, created = FirstContactTracker.objects.get_or_create(
-        sender=request.user,
-        receiver=other_user
-    )
-    
-    if not first_contact.can_send_more:
+    has_tracker = other_user.sent_count is not None
+    limited = has_tracker and not other_user.sent_replied
+    if limited and other_user.sent_count >= FIRST_CONTACT_LIMIT:
         django_messages.error(request, 'You have reached the 3-message limit. Wait for them to reply.')
         return redirect('messaging:conversation', user_id=user_id)
     
-    # Create message
-    Message.objects.create(
-        conversation=conversation,
-        sender=request.user,
-        receiver=other_user,
-        content=content
-    )
-    
-    # Update first contact tracker
-    if not first_contact.receiver_replied:
-        first_contact.message_count += 1
-        first_contact.save()
-    
-    # Check if receiver has replied to sender
-    reverse_tracker = FirstContactTracker.objects.filter(
-        sender=other_user,
-        receiver=request.user
-    ).first()
-    
-    if reverse_tracker and not reverse_tracker.receiver_replied:
-        reverse_tracker.receiver_replied = True
-        reverse_tracker.save()
-    
-    conversation.updated_at = timezone.now()
-    conversation.save()
+    with transaction.atomic(using=Message.objects.db):
+        # Count the message against the first contact limit; the conditional
+        # update also stops concurrent sends from going over the limit
+        if not has_tracker:
+            try:
+                with transaction.atomic(using=Message.objects.db):
+                    FirstContactTracker.objects.create(
+                        sender=request.user,
+                        receiver=other_user,
+                        message_count=1
+                    )
+                limited = False
+            except IntegrityError:
+                # A concurrent send created it first
+                limited = True
+        if limited:
+            counted = FirstContactTracker.objects.filter(
+                sender=request.user,
+                receiver=other_user,
+                receiver_replied=False,
+                message_count__lt=FIRST_CONTACT_LIMIT
+            ).update(message_count=F('message_count') + 1)
+            if not counted:
+                transaction.set_rollback(True, using=Message.objects.db)
+                django_messages.error(request, 'You have reached the 3-message limit. Wait for them to reply.')
+                return redirect('messaging:conversation', user_id=user_id)
+        
+        # Create the conversation on the first message; the read above found none
+        conversation_id = other_user.existing_conversation_id
+        if conversation_id is None:
+            conversation_id = Conversation.objects.create_between(request.user, other_user).pk
+        
+        # Create message
+        message = Message.objects.create(
+            conversation_id=conversation_id,
+            sender=request.user,
+            receiver=other_user,
+            content=content
+        )
+        
+        # This message is a reply to the other user's first contact
+        if other_user.reply_owed:
+            FirstContactTracker.objects.filter(
+                sender=other_user,
+                receiver=request.user,
+                receiver_replied=False
+            ).update(receiver_replied=True)
+        
+        publish_message(message)
     
     return redirect('messaging:conversation', user_id=user_id)
 
 @login_required
 def start_conversation(request):
     """Start a new conversation"""
-    if request.method == 'POST':
-        username = request.POST.get('username', '').strip()
-        try:
-            other_user = User.objects.get(username=username)
-            if other_user == request.user:
-                django_messages.error(request, 'You cannot message yourself.')
-                return redirect('messaging:inbox')
-            return redirect('messaging:conversation', user_id=other_user.id)
-        except User.DoesNotExist:
-            django_messages.error(request, 'User not found.')
-            return redirect('messaging:inbox')
-    
-    # Get all users except current user
-    users = User.objects.exclude(id=request.user.id).order_by('username')
-    return render(request, 'messaging/start_conversation.html', {'users': users})
+    # One page of matching users, blocks either way filtered out in the same query.
+    # Keyset pagination on the unique username keeps every page a short index range
+    query = request.GET.get('q', '').strip()
+    after = request.GET.get('after', '')
+    users = exclude_blocked(User.objects.exclude(id=request.user.id), request.user)
+    if query:
+        users = users.filter(
+            Q(username__istartswith=query) | Q(first_name__istartswith=query) | Q(last_name__istartswith=query)
+        )
+    if after:
+        users = users.filter(username__gt=after)
+    users = list(users.only('id', 'username', 'first_name', 'last_name').order_by('username')[:USER_PICKER_PAGE_SIZE + 1])
+    
+    context = {
+        'users': users[:USER_PICKER_PAGE_SIZE],
+        'query': query,
+        'next_after': users[USER_PICKER_PAGE_SIZE - 1].username if len(users) > USER_PICKER_PAGE_SIZE else None,
+    }
+    return render(request, 'messaging/start_conversation.html', context)
 
 @login_required
-def group_chat(request, group_type):
-    """View group chat (all members or admins only)"""
-    if group_type not in ['all', 'admin']:
-        django_messages.error(request, 'Invalid group type.')
-        return redirect('messaging:inbox')
+def message_search(request):
+    """Full-text search over the user's conversations and group chats"""
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        results = search_messages(request.user, query, get_group_access(request.user).ids)
+    
+    for msg in results:
+        if not msg.is_group_message:
+            msg.other_user = msg.conversation.get_other_user(request.user)
     
-    # Check permissions
-    if group_type == 'admin' and not request.user.is_admin:
-        django_messages.error(request, 'You do not have access to admin chat.')
+    context = {
+        'query': query,
+        'results': results,
+    }
+    return render(request, 'messaging/search.html', context)
+
+@login_required
+def group_chat(request, slug):
+    """View a group chat"""
+    group = readable_group(request, slug)
+    if group is None:
         return redirect('messaging:inbox')
     
-    # Get messages
-    group_messages = Message.objects.filter(
-        is_group_message=True,
-        group_type=group_type
-    ).select_related('sender').order_by('created_at')
+    # Get the most recent messages; older ones are fetched on scroll
+    group_messages, history_cursor = history_page(
+        Message.objects.filter(
+            is_group_message=True,
+            group_id=group.id
+        ).prefetch_related('sender'),
+        ArchivedMessage.objects.filter(is_group_message=True, group_id=group.id).prefetch_related('sender'),
+        None,
+        HISTORY_PAGE_SIZE,
+    )
+    
+    # Opening the chat reads everything in it
+    if group_messages:
+        ChatMembership.objects.mark_read(request.user, group.id, group_messages[-1].id)
     
     context = {
-        'group_type': group_type,
-        'group_name': 'All Members' if group_type == 'all' else 'Admins Only',
+        'group': group,
+        'group_name': group.name,
         'messages': group_messages,
+        'last_message_id': group_messages[-1].id if group_messages else 0,
+        'history_cursor': history_cursor,
     }
     return render(request, 'messaging/group_chat.html', context)
 
 @login_required
-def send_group_message(request, group_type):
+@rate_limit('messaging.send_group')
+def send_group_message(request, slug):
     """Send a group message"""
     if request.method != 'POST':
-        return redirect('messaging:group_chat', group_type=group_type)
-    
-    if group_type not in ['all', 'admin']:
-        django_messages.error(request, 'Invalid group type.')
-        return redirect('messaging:inbox')
+        return redirect('messaging:group_chat', slug=slug)
     
-    # Check permissions
-    if group_type == 'admin' and not request.user.is_admin:
-        django_messages.error(request, 'You do not have access to admin chat.')
+    group = readable_group(request, slug)
+    if group is None:
         return redirect('messaging:inbox')
     
     content = request.POST.get('content', '').strip()
     
     if not content:
         django_messages.error(request, 'Message cannot be empty.')
-        return redirect('messaging:group_chat', group_type=group_type)
+        return redirect('messaging:group_chat', slug=slug)
     
-    # Create group message
-    Message.objects.create(
+    # One row however many members the group has; they read it through their cursors
+    message = Message(
         sender=request.user,
         content=content,
         is_group_message=True,
-        group_type=group_type
+        group_id=group.id
+    )
+    if settings.MESSAGING_GROUP_BATCHING:
+        # Returns once the batch holding this message has committed, or the message
+        # was saved directly because the flusher did not pick it up in time
+        try:
+            group_message_batcher.save(message, timeout=settings.MESSAGING_GROUP_BATCH_TIMEOUT)
+        except FutureTimeoutError:
+            return HttpResponse(
+                'The group chat is busy and your message may not have been sent. Please check before resending.',
+                status=503,
+                content_type='text/plain',
+            )
+    else:
+        message.save()
+        publish_message(message)
+    
+    return redirect('messaging:group_chat', slug=slug)
+
+def check_new_etag(request):
+    """Version stamp for check_new_messages, computed from the cache alone"""
+    return mailbox_etag(
+        request.user,
+        get_group_access(request.user).ids,
+        extra=request.META.get('QUERY_STRING', ''),
     )
-    
-    return redirect('messaging:group_chat', group_type=group_type)
 
 @login_required
+@rate_limit('messaging.poll')
+@condition(etag_func=check_new_etag)
 def check_new_messages(request):
-    """AJAX endpoint to check for new messages"""
+    """AJAX endpoint to check for new messages
+    
+    Sends the mailbox version as an ETag; polls that send it back in If-None-Match
+    get 304 Not Modified without touching the message tables.
+    """
     last_check = request.GET.get('last_check', 0)
     
     try:
@@ -251,68 +454,196 @@ def check_new_messages(request):
     except:
         last_check = 0
     
-    # Get total unread count
-    total_unread = Message.objects.filter(
-        receiver=request.user,
-        is_read=False
-    ).count()
-    
     # Get new messages since last check (for current conversation if specified)
     user_id = request.GET.get('user_id')
     new_messages = []
     
     if user_id:
         try:
-            other_user = User.objects.get(pk=user_id)
-            conversation = Conversation.objects.filter(
-                Q(user1=request.user, user2=other_user) | 
-                Q(user1=other_user, user2=request.user)
-            ).first()
+            conversation = Conversation.objects.between(request.user, int(user_id), create=False)
             
             if conversation:
                 messages_qs = conversation.messages.filter(
                     id__gt=last_check
-                ).select_related('sender')
+                ).prefetch_related('sender')
                 
                 for msg in messages_qs:
-                    new_messages.append({
-                        'id': msg.id,
-                        'sender': msg.sender.username,
-                        'sender_name': msg.sender.get_full_name() or msg.sender.username,
-                        'content': msg.content,
-                        'time': msg.created_at.strftime('%I:%M %p'),
-                        'is_mine': msg.sender == request.user,
-                    })
+                    new_messages.append(dict(
+                        message_to_dict(msg),
+                        is_mine=msg.sender_id == request.user.id,
+                    ))
                 
-                # Mark as read
-                conversation.messages.filter(
-                    receiver=request.user,
-                    is_read=False
-                ).update(is_read=True)
+                # Mark as read (only when something new was delivered)
+                if new_messages:
+                    conversation.mark_read(request.user, max(m['id'] for m in new_messages))
         except:
             pass
     
     # Check group messages
-    group_type = request.GET.get('group_type')
-    if group_type in ['all', 'admin']:
-        if group_type == 'all' or request.user.is_admin:
-            group_messages_qs = Message.objects.filter(
-                is_group_message=True,
-                group_type=group_type,
-                id__gt=last_check
-            ).select_related('sender')
-            
-            for msg in group_messages_qs:
-                new_messages.append({
-                    'id': msg.id,
-                    'sender': msg.sender.username,
-                    'sender_name': msg.sender.get_full_name() or msg.sender.username,
-                    'content': msg.content,
-                    'time': msg.created_at.strftime('%I:%M %p'),
-                    'is_mine': msg.sender == request.user,
-                })
-    
-    return JsonResponse({
+    group = get_group_access(request.user).get(request.GET.get('group'))
+    if group:
+        group_messages_qs = Message.objects.filter(
+            is_group_message=True,
+            group_id=group.id,
+            id__gt=last_check
+        ).prefetch_related('sender')
+        
+        group_new = [
+            dict(message_to_dict(msg), is_mine=msg.sender_id == request.user.id)
+            for msg in group_messages_qs
+        ]
+        if group_new:
+            ChatMembership.objects.mark_read(request.user, group.id, group_new[-1]['id'])
+        new_messages.extend(group_new)
+    
+    # Total unread after anything delivered above was marked read
+    total_unread = total_unread_for(request.user)
+    
+    response = JsonResponse({
         'new_messages': new_messages,
         'total_unread': total_unread,
-    })
\ No newline at end of file
+    })
+    # Make browsers revalidate with the ETag on every poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@gzip_page
+@login_required
+@rate_limit('messaging.poll')
+@condition(etag_func=check_new_etag)
+def sync_messages(request):
+    """Delta sync for every open chat view and the unread badge in one poll
+    
+    Takes repeated ``conversation=<user_id>:<last_id>`` and ``group=<slug>:<last_id>``
+    cursors and returns the new messages of each under ``conversation:<user_id>``
+    or ``group:<slug>``, plus the badge count. The query count does not depend on
+    how many streams are watched. ``has_more`` means the message limit was hit and
+    the client should poll again. Shares check_new_messages' ETag, so an unchanged
+    mailbox answers 304.
+    """
+    deltas, has_more = collect_deltas(
+        request.user,
+        parse_cursors(request.GET.getlist('conversation')),
+        parse_cursors(request.GET.getlist('group')),
+    )
+    
+    response = JsonResponse({
+        'messages': deltas,
+        'has_more': has_more,
+        'total_unread': total_unread_for(request.user),
+    })
+    # Make browsers revalidate with the ETag on every poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+def message_history(request):
+    """AJAX endpoint returning a page of older messages before a cursor"""
+    cursor = decode_cursor(request.GET.get('before'))
+    if not cursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    
+    user_id = request.GET.get('user_id')
+    group_slug = request.GET.get('group')
+    
+    if user_id and user_id.isdigit():
+        if get_block_set(request.user).involves(int(user_id)):
+            return JsonResponse({'error': 'You cannot view this conversation.'}, status=403)
+        
+        conversation = Conversation.objects.between(request.user, int(user_id), create=False)
+        if not conversation:
+            return JsonResponse({'messages': [], 'next_cursor': None})
+        queryset = conversation.messages.all()
+        archived = conversation.archived_messages.all()
+    elif group_slug:
+        group = get_group_access(request.user).get(group_slug)
+        if group is None:
+            return JsonResponse({'error': 'You do not have access to this group chat.'}, status=403)
+        queryset = Message.objects.filter(is_group_message=True, group_id=group.id)
+        archived = ArchivedMessage.objects.filter(is_group_message=True, group_id=group.id)
+    else:
+        return JsonResponse({'error': 'Specify user_id or group.'}, status=400)
+    
+    history, next_cursor = history_page(
+        queryset.prefetch_related('sender'),
+        archived.prefetch_related('sender'),
+        cursor,
+        HISTORY_PAGE_SIZE,
+    )
+    return JsonResponse({
+        'messages': [
+            dict(message_to_dict(msg), is_mine=msg.sender_id == request.user.id)
+            for msg in history
+        ],
+        'next_cursor': next_cursor,
+    })
+
+def sse_event(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@login_required
+async def message_stream(request):
+    """Server-Sent Events stream of new messages and unread badge changes
+    
+    Pass ``user_id`` when viewing a conversation, or ``group`` (the slug) when
+    viewing a group chat, so delivered messages are marked read.
+    """
+    user = await request.auser()
+    access = await sync_to_async(get_group_access)(user)
+    channels = [user_channel(user.id)] + [group_channel(group_id) for group_id in access.ids]
+    
+    watched_conversation = None
+    watched_user_id = request.GET.get('user_id')
+    if watched_user_id and watched_user_id.isdigit():
+        watched_conversation = await sync_to_async(Conversation.objects.between)(
+            user, int(watched_user_id), create=False
+        )
+    watched_group = access.get(request.GET.get('group'))
+    
+    async def events():
+        subscription = broker.subscribe(channels)
+        unread_changed = False
+        group_read_id = None
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                
+                message = event['message']
+                is_mine = message['sender_id'] == user.id
+                yield sse_event('message', dict(
+                    message,
+                    is_mine=is_mine,
+                    conversation_id=event['conversation_id'],
+                    group_id=event['group_id'],
+                ))
+                
+                if event['receiver_id'] == user.id:
+                    if watched_conversation and watched_conversation.pk == event['conversation_id']:
+                        await sync_to_async(watched_conversation.mark_read)(user, message['id'])
+                    unread_changed = True
+                elif event['group_id'] and not is_mine:
+                    if watched_group and event['group_id'] == watched_group.id:
+                        group_read_id = message['id']
+                    unread_changed = True
+                
+                # A burst of group messages is recounted once, when the queue drains
+                if unread_changed and subscription.queue.empty():
+                    if group_read_id:
+                        await sync_to_async(ChatMembership.objects.mark_read)(user, watched_group.id, group_read_id)
+                        group_read_id = None
+                    total_unread = await sync_to_async(total_unread_for)(user)
+                    yield sse_event('unread', {'total_unread': total_unread})
+                    unread_changed = False
+        finally:
+            subscription.close()
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ModerationConfig(AppConfig):
     name = 'moderation'
+
+    def ready(self):
+        from . import checks  # noqa: F401
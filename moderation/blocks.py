@@ -0,0 +1,64 @@
+from typing import NamedTuple
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+BLOCK_CACHE_TIMEOUT = 300
+
+
+class BlockSet(NamedTuple):
+    """Block relationships of one user, both directions"""
+    
+    blocking: frozenset
+    blocked_by: frozenset
+    
+    @property
+    def user_ids(self):
+        """Every user on either side of a block with this user"""
+        return self.blocking | self.blocked_by
+    
+    def involves(self, user_id):
+        return user_id in self.blocking or user_id in self.blocked_by
+
+
+def block_cache_key(user_id):
+    return f'moderation:blocks:{user_id}'
+
+
+def get_block_set(user):
+    """Load a user's block relationships once and serve them from the cache"""
+    from .models import Block
+    
+    key = block_cache_key(user.pk)
+    block_set = cache.get(key)
+    if block_set is None:
+        blocking, blocked_by = set(), set()
+        rows = Block.objects.filter(
+            Q(blocker=user) | Q(blocked=user)
+        ).order_by().values_list('blocker_id', 'blocked_id')
+        for blocker_id, blocked_id in rows:
+            if blocker_id == user.pk:
+                blocking.add(blocked_id)
+            else:
+                blocked_by.add(blocker_id)
+        block_set = BlockSet(frozenset(blocking), frozenset(blocked_by))
+        cache.set(key, block_set, BLOCK_CACHE_TIMEOUT)
+    return block_set
+
+
+def exclude_blocked(queryset, user, field='pk'):
+    """Drop rows whose ``field`` is a user with a block either way with ``user``
+    
+    A single NOT EXISTS anti-join against Block, for querysets in the same
+    database; the cached block set is for everything else.
+    """
+    from .models import Block
+    
+    blocks = Block.objects.filter(
+        Q(blocker=user, blocked=OuterRef(field)) | Q(blocker=OuterRef(field), blocked=user)
+    )
+    return queryset.filter(~Exists(blocks))
+
+
+def invalidate_block_cache(*user_ids):
+    # Every worker reads the same cache, so one delete reaches all of them
+    cache.delete_many([block_cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Backends whose entries only exist inside one worker process
+PER_PROCESS_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Block sets are invalidated through the cache, so every worker has to share it"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PER_PROCESS_CACHES:
+        return [Warning(
+            'The default cache is local to each process, so blocking someone only '
+            'clears the cached block set in the worker that served the request.',
+            hint='Point CACHES["default"] at a cache every worker shares.',
+            id='moderation.W001',
+        )]
+    return []
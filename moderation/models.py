@@ -1,5 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .blocks import invalidate_block_cache
 
 class Report(models.Model):
     """Member report system"""
@@ -54,4 +57,12 @@ class Block(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.blocker.username} blocked {self.blocked.username}"
\ No newline at end of file
+        return f"{self.blocker.username} blocked {self.blocked.username}"
+
+
+# Keep cached block sets in step with the table, for both users involved
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def clear_block_cache(sender, instance, **kwargs):
+    """Drop the cached block sets of both users when a block changes"""
+    invalidate_block_cache(instance.blocker_id, instance.blocked_id)
\ No newline at end of file
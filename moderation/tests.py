@@ -1,3 +1,49 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from accounts.models import User
+from .blocks import get_block_set
+from .checks import check_shared_cache
+from .models import Block
 
-# Create your tests here.
+
+class BlockSetCacheTests(TestCase):
+    """Block relationships are loaded once and invalidated on change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass')
+        cls.carol = User.objects.create_user('carol', 'carol@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_both_directions_loaded_once(self):
+        Block.objects.create(blocker=self.alice, blocked=self.bob)
+        Block.objects.create(blocker=self.carol, blocked=self.alice)
+        with self.assertNumQueries(1):
+            blocks = get_block_set(self.alice)
+            get_block_set(self.alice)
+        self.assertEqual(blocks.blocking, {self.bob.id})
+        self.assertEqual(blocks.blocked_by, {self.carol.id})
+        self.assertTrue(blocks.involves(self.carol.id))
+
+    def test_block_and_unblock_invalidate_both_users(self):
+        self.client.force_login(self.alice)
+        self.assertFalse(get_block_set(self.bob).involves(self.alice.id))
+
+        self.client.get(reverse('moderation:block_user', args=[self.bob.id]))
+        self.assertIn(self.bob.id, get_block_set(self.alice).blocking)
+        self.assertIn(self.alice.id, get_block_set(self.bob).blocked_by)
+
+        self.client.get(reverse('moderation:unblock_user', args=[self.bob.id]))
+        self.assertFalse(get_block_set(self.alice).involves(self.bob.id))
+        self.assertFalse(get_block_set(self.bob).involves(self.alice.id))
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/cache'}
+        with override_settings(CACHES={'default': shared}):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['moderation.W001'])
@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from accounts.models import User
+from .blocks import get_block_set
 from .models import Report, Block
 from .forms import ReportForm
 
@@ -63,7 +64,7 @@ def block_user(request, user_id):
         return redirect('accounts:members')
     
     # Check if already blocked
-    if Block.objects.filter(blocker=request.user, blocked=blocked_user).exists():
+    if blocked_user.id in get_block_set(request.user).blocking:
         messages.info(request, 'User is already blocked.')
         return redirect('moderation:blocked_users')
     